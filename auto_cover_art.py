@@ -10,13 +10,38 @@ import argparse
 import subprocess
 import json
 import logging
-import urllib.request
 import urllib.parse
+import urllib.error
+import http.client
+import io
+import email.utils
+import ssl
+import gzip
+import hashlib
+import sqlite3
+import threading
+import base64
+import collections
+import ctypes
+import ctypes.util
 from mutagen import File as MutagenFile
-from mutagen.id3 import ID3, APIC
+from mutagen.id3 import ID3, APIC, TXXX, UFID
 from mutagen.flac import FLAC, Picture
-from mutagen.mp4 import MP4, MP4Cover
+from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
 import time
+import asyncio
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import av
+except ImportError:
+    av = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 # Configure logging
 logging.basicConfig(
@@ -32,14 +57,512 @@ if not ACOUSTID_API_KEY:
     sys.exit(1)
 
 ACOUSTID_API_URL = 'https://api.acoustid.org/v2/lookup'
+# Release groups carry the primary/secondary types used to rank candidates
+ACOUSTID_META = 'recordings releasegroups releases'
+# Fingerprints sent per AcoustID request in batch mode
+ACOUSTID_BATCH_SIZE = 10
 MUSICBRAINZ_API_URL = 'https://musicbrainz.org/ws/2'
 COVERARTARCHIVE_URL = 'https://coverartarchive.org/release'
 
+# Keep-alive connections shared by all requests to one host
+HTTP_MAX_CONNECTIONS_PER_HOST = 4
+HTTP_MAX_REDIRECTS = 5
+HTTP_USER_AGENT = 'auto_cover_art/1.0 ( https://github.com/alex-903/auto_cover_art )'
+
+# Fingerprinting: 'fpcalc' spawns the Chromaprint CLI, 'chromaprint' decodes
+# with PyAV (or an ffmpeg pipe) and calls libchromaprint in-process
+FINGERPRINT_BACKEND = 'fpcalc'
+# Seconds of audio fingerprinted, as with fpcalc -length
+FINGERPRINT_LENGTH = 120
+# PCM format fed to libchromaprint
+CHROMAPRINT_SAMPLE_RATE = 44100
+CHROMAPRINT_CHANNELS = 2
+
+# Requests per second allowed per host; hosts not listed are not throttled
+# but still back off when they answer 429/503
+ACOUSTID_HOST = urllib.parse.urlsplit(ACOUSTID_API_URL).hostname
+COVERARTARCHIVE_HOST = urllib.parse.urlsplit(COVERARTARCHIVE_URL).hostname
+MUSICBRAINZ_HOST = urllib.parse.urlsplit(MUSICBRAINZ_API_URL).hostname
+RATE_LIMITS = {
+    ACOUSTID_HOST: 3.0,
+    MUSICBRAINZ_HOST: 1.0,
+}
+# Retries of a request that was answered with 429 or 503
+RATE_LIMIT_RETRIES = 3
+
+# Extensions picked up when walking directories
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.flac', '.ogg', '.opus', '.aiff', '.aif')
+
+# Persistent cache (fingerprints, lookups); set to None to disable caching
+CACHE_DIR = os.getenv(
+    'AUTO_COVER_ART_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'auto_cover_art')
+)
+# Also key cached fingerprints by a SHA-256 of the file contents, so moved
+# or touched files are still recognised
+HASH_FILES = False
+# Seconds a cached release -> cover URL answer stays valid; releases without
+# art are re-checked sooner since art gets uploaded over time
+RELEASE_ART_TTL = 30 * 24 * 3600
+NO_ART_TTL = 7 * 24 * 3600
+# Request CAA's sized front image directly (one request instead of JSON
+# listing + download); CAA_FRONT_SIZE is 250, 500, 1200 or original
+CAA_DIRECT = False
+CAA_FRONT_SIZE = '1200'
+# Image size policy: prefer CAA thumbnails no smaller than MAX_IMAGE_EDGE
+# pixels, and downsize/re-encode (needs Pillow) anything larger than that
+# or than MAX_IMAGE_BYTES before embedding. None disables a limit.
+MAX_IMAGE_EDGE = None
+MAX_IMAGE_BYTES = None
+CAA_THUMBNAIL_SIZES = (250, 500, 1200)
+# Distinct resized images remembered per batch run, so an album's cover is
+# only resized once
+RESIZED_IMAGE_MEMO_SIZE = 32
+# Upper bound on the downloaded image store; least recently used images go first
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    content_hash TEXT,
+    fingerprint TEXT NOT NULL,
+    duration INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_content_hash ON fingerprints (content_hash);
+CREATE TABLE IF NOT EXISTS release_art (
+    release_id TEXT PRIMARY KEY,
+    image_url TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_last_used ON images (last_used);
+CREATE TABLE IF NOT EXISTS image_urls (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS library (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    has_art INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+'''
+
+# With INCREMENTAL, directory scans consult the library index and only queue
+# new or changed files, plus files still missing art after LIBRARY_RETRY_AFTER
+INCREMENTAL = False
+LIBRARY_RETRY_AFTER = 7 * 24 * 3600
+
+# Batch runs record each file's outcome in a journal so --resume can pick up
+# after a crash; None keeps it next to the cache
+JOURNAL_PATH = None
+RESUME = False
+# On --resume, files that failed more recently than this are not retried
+RESUME_RETRY_FAILED_AFTER = 24 * 3600
+JOURNAL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS journal (
+    run TEXT NOT NULL,
+    path TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run, path)
+);
+'''
+
+def available_cpus():
+    """Number of CPUs this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# Concurrent workers per batch pipeline stage, and the bound on each stage's
+# queue. Fingerprinting is CPU-bound decoding, so it gets one worker per core.
+STAGE_WORKERS = {
+    'album': 2,
+    'fingerprint': available_cpus(),
+    'lookup': 1,
+    'fetch': 4,
+    'resize': 2,
+    'embed': 2,
+}
+QUEUE_SIZE = 64
+# Files fingerprinted per fpcalc invocation in batch mode
+FPCALC_BATCH_SIZE = 8
+# How long a batching stage waits for more items to fill a batch
+LOOKUP_BATCH_WAIT = 0.25
+
+# Tag keys that hold pictures outside ID3 and FLAC picture blocks: MP4,
+# Vorbis comments (Ogg Vorbis/Opus/FLAC), legacy Vorbis, ASF and APEv2
+PICTURE_TAG_KEYS = ('covr', 'metadata_block_picture', 'coverart', 'WM/Picture', 'Cover Art (Front)')
+# Ask ffprobe about files mutagen cannot parse
+FFPROBE_FALLBACK = True
+
+# Album mode: identify each directory's release from a few of its tracks and
+# give every sibling whose duration fits that release the same cover
+ALBUM_MODE = False
+ALBUM_SAMPLE_TRACKS = 2
+ALBUM_MAX_CANDIDATES = 5
+# Seconds a file's duration may differ from the MusicBrainz track length
+ALBUM_DURATION_TOLERANCE = 3.0
+
+# Local art: folder images (checked in this order, case-insensitively) and
+# embedded art of sibling files are used before any network lookup
+LOCAL_ART = True
+FOLDER_IMAGE_NAMES = ('cover.jpg', 'cover.png', 'folder.jpg', 'folder.png', 'front.jpg', 'front.png')
+# Directories whose local art is remembered
+LOCAL_ART_MEMO_SIZE = 64
+
+# Text tags read from files, by tagging scheme: (ID3 frame, MP4 atom, Vorbis comment)
+TAG_NAMES = {
+    'album': ('TALB', '\xa9alb', 'album'),
+    'musicbrainz_albumid': (
+        'TXXX:MusicBrainz Album Id',
+        '----:com.apple.iTunes:MusicBrainz Album Id',
+        'musicbrainz_albumid',
+    ),
+    'musicbrainz_recordingid': (
+        'UFID:http://musicbrainz.org',
+        '----:com.apple.iTunes:MusicBrainz Track Id',
+        'musicbrainz_trackid',
+    ),
+    'acoustid_id': ('TXXX:Acoustid Id', '----:com.apple.iTunes:Acoustid Id', 'acoustid_id'),
+    'acoustid_fingerprint': (
+        'TXXX:Acoustid Fingerprint',
+        '----:com.apple.iTunes:Acoustid Fingerprint',
+        'acoustid_fingerprint',
+    ),
+}
+# Write the AcoustID id, MusicBrainz recording/release ids and fingerprint
+# that led to the embedded art, so later runs can use them with USE_TAGS
+WRITE_TAGS = False
+# Trust identifiers written by Picard/beets (MusicBrainz album id, AcoustID
+# track id and fingerprint) to skip fingerprinting and lookups
+USE_TAGS = False
+
+# Candidate ranking: releases are tried best-first, at most MAX_CANDIDATES
+# per file. Weights for the AcoustID match score, how many recordings a
+# release appears under, release group type and agreement with siblings.
+MAX_CANDIDATES = 10
+# Candidates whose Cover Art Archive entries are probed at the same time;
+# 1 probes them one after another
+PROBE_CONCURRENCY = 1
+RANK_WEIGHTS = {
+    'score': 10.0,
+    'frequency': 3.0,
+    'type': 1.0,
+    'siblings': 5.0,
+}
+RELEASE_TYPE_BONUS = {'Album': 2.0, 'EP': 1.0, 'Single': 0.5}
+SECONDARY_TYPE_PENALTY = {'Compilation': 2.0, 'Live': 1.5, 'DJ-mix': 1.5, 'Mixtape/Street': 1.0, 'Remix': 1.0}
+# Directories whose chosen releases are remembered for sibling agreement
+DIRECTORY_RELEASES_MEMO_SIZE = 256
+
+# Outcomes returned by process_file
+SUCCESS = 'success'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+class RateLimiter:
+    """Token bucket for one host that slows down when the host pushes back."""
+
+    def __init__(self, rate=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(1.0, rate or 0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping only while the bucket is empty or a back-off is active."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if not self.rate:
+                        return
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def back_off(self, delay):
+        """Pause the host for delay seconds and halve its rate."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.tokens = 0
+            if self.rate:
+                self.rate = max(self.max_rate / 8, self.rate / 2)
+
+    def succeeded(self):
+        """Creep back towards the configured rate after a backed-off period."""
+        with self._lock:
+            if self.rate and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate * 1.1)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(host):
+    """Return the shared RateLimiter for a host, configured from RATE_LIMITS."""
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(RATE_LIMITS.get(host))
+        return _rate_limiters[host]
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait and get its result (or its exception) instead of
+    repeating the work. Nothing is kept once the call finishes.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func(*args)
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+INFLIGHT = SingleFlight()
+
+def parse_retry_after(value, default):
+    """Convert a Retry-After header (seconds or HTTP date) to a delay in seconds."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections reused across requests, limited per host."""
+
+    def __init__(self, max_per_host):
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+        self._ssl_context = ssl.create_default_context()
+
+    def _slot(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self._slots[key]
+
+    def _checkout(self, key, timeout):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def _send(self, method, url, body, headers, timeout):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        
+        with self._slot(key):
+            while True:
+                conn, reused = self._checkout(key, timeout)
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if reused:
+                        # The server dropped an idle connection; retry on a fresh one
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._checkin(key, conn)
+                return response.status, response.reason, response.headers, data
+
+    def _send_limited(self, method, url, body, headers, timeout):
+        host = urllib.parse.urlsplit(url).hostname
+        limiter = get_rate_limiter(host)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            limiter.acquire()
+            result = self._send(method, url, body, headers, timeout)
+            status, response_headers = result[0], result[2]
+            if status not in (429, 503):
+                limiter.succeeded()
+                return result
+            if attempt == RATE_LIMIT_RETRIES:
+                return result
+            delay = parse_retry_after(response_headers.get('Retry-After'), 2 ** attempt)
+            logger.warning(f"{host} answered {status}, backing off for {delay:.1f}s")
+            limiter.back_off(delay)
+
+    def request(self, method, url, body=None, headers=None, timeout=30):
+        """Send a rate-limited request, following redirects. Returns (status, reason, headers, body)."""
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', HTTP_USER_AGENT)
+        for _ in range(HTTP_MAX_REDIRECTS + 1):
+            status, reason, response_headers, data = self._send_limited(method, url, body, headers, timeout)
+            location = response_headers.get('Location')
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                if status == 303 or (status in (301, 302) and method == 'POST'):
+                    method, body = 'GET', None
+                    for name in ('Content-Type', 'Content-Encoding'):
+                        headers.pop(name, None)
+                continue
+            return status, reason, response_headers, data
+        raise urllib.error.URLError(f"Too many redirects for {url}")
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+HTTP_POOL = ConnectionPool(HTTP_MAX_CONNECTIONS_PER_HOST)
+
+def http_request(url, data=None, headers=None, timeout=30):
+    """Fetch a URL through the shared connection pool and return the body.
+
+    Raises urllib.error.HTTPError for error statuses, like urlopen.
+    """
+    method = 'GET' if data is None else 'POST'
+    status, reason, response_headers, body = HTTP_POOL.request(method, url, data, headers, timeout)
+    if status >= 400:
+        raise urllib.error.HTTPError(url, status, reason, response_headers, io.BytesIO(body))
+    return body
+
+_cache_db = None
+_cache_lock = threading.Lock()
+
+def get_cache_db():
+    """Open the SQLite cache on first use. Returns None if caching is disabled or unavailable."""
+    global _cache_db, CACHE_DIR
+    with _cache_lock:
+        if _cache_db is None and CACHE_DIR:
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                db = sqlite3.connect(os.path.join(CACHE_DIR, 'cache.db'), check_same_thread=False)
+                db.execute('PRAGMA journal_mode=WAL')
+                db.executescript(CACHE_SCHEMA)
+                _cache_db = db
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f"Failed to open cache in {CACHE_DIR}, caching disabled: {e}")
+                CACHE_DIR = None
+        return _cache_db
+
+def hash_file(filepath):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_cached_fingerprint(filepath, st, content_hash=None):
+    """Look up a stored (fingerprint, duration) by file identity, then by content hash."""
+    db = get_cache_db()
+    if db is None:
+        return None, None
+    try:
+        with _cache_lock:
+            row = db.execute(
+                'SELECT fingerprint, duration FROM fingerprints '
+                'WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+                (filepath, st.st_size, st.st_mtime_ns, st.st_ino)
+            ).fetchone()
+            if row is None and content_hash:
+                row = db.execute(
+                    'SELECT fingerprint, duration FROM fingerprints WHERE content_hash = ? LIMIT 1',
+                    (content_hash,)
+                ).fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"Fingerprint cache lookup failed: {e}")
+        return None, None
+    return row if row else (None, None)
+
+def store_fingerprint(filepath, st, fingerprint, duration, content_hash=None):
+    """Remember a fingerprint for this exact version of the file."""
+    db = get_cache_db()
+    if db is None:
+        return
+    try:
+        with _cache_lock, db:
+            db.execute(
+                'INSERT OR REPLACE INTO fingerprints '
+                '(path, size, mtime_ns, inode, content_hash, fingerprint, duration) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (filepath, st.st_size, st.st_mtime_ns, st.st_ino, content_hash, fingerprint, duration)
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Failed to store fingerprint: {e}")
+
 def run_fpcalc(filepath):
     """Run fpcalc to generate audio fingerprint."""
     try:
         result = subprocess.run(
-            ['fpcalc', '-json', '-length', '120', filepath],
+            ['fpcalc', '-json', '-length', str(FINGERPRINT_LENGTH), filepath],
             capture_output=True,
             text=True,
             check=True
@@ -56,87 +579,706 @@ def run_fpcalc(filepath):
         logger.error(f"Failed to parse fpcalc output: {e}")
         return None, None
 
-def lookup_acoustid(fingerprint, duration):
-    """Look up fingerprint in AcoustID database."""
-    time.sleep(1)
-    params = {
-        'client': ACOUSTID_API_KEY,
-        'meta': 'recordings releases',
-        'fingerprint': fingerprint,
-        'duration': str(duration)
-    }
+def parse_fpcalc_text(output):
+    """Parse fpcalc's plain-text output into a list of dicts, one per file block.
+
+    A block ends at a blank line, a FILE= line or a key the block already
+    has, so output without separators still splits per file.
+    """
+    blocks = []
+    current = {}
+    for line in output.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append(current)
+                current = {}
+            continue
+        key, sep, value = line.partition('=')
+        if not sep:
+            continue
+        if current and (key == 'FILE' or key in current):
+            blocks.append(current)
+            current = {}
+        current[key] = value
+    if current:
+        blocks.append(current)
+    return blocks
+
+def run_fpcalc_batch(filepaths):
+    """Fingerprint several files with a single fpcalc invocation.
+
+    Returns {filepath: (fingerprint, duration)}. Results are mapped back by
+    the FILE= lines fpcalc prints for multiple inputs (or by position when
+    every file produced a result). Files missing from the output, e.g.
+    because they are corrupt, are retried on their own with run_fpcalc so
+    one bad file cannot fail its neighbours.
+    """
+    if len(filepaths) == 1:
+        return {filepaths[0]: run_fpcalc(filepaths[0])}
+    
+    fingerprints = {}
+    try:
+        # JSON output carries no file names, so use the text format
+        result = subprocess.run(
+            ['fpcalc', '-length', str(FINGERPRINT_LENGTH)] + list(filepaths),
+            capture_output=True,
+            text=True
+        )
+        blocks = [b for b in parse_fpcalc_text(result.stdout) if b.get('FINGERPRINT')]
+        if all('FILE' in b for b in blocks):
+            by_name = {b['FILE']: b for b in blocks}
+            matched = [(path, by_name.get(path)) for path in filepaths]
+        elif len(blocks) == len(filepaths):
+            matched = list(zip(filepaths, blocks))
+        else:
+            matched = []
+        for path, block in matched:
+            if block:
+                fingerprints[path] = (block['FINGERPRINT'], int(float(block.get('DURATION', 0))))
+    except FileNotFoundError:
+        logger.error("fpcalc not found. Please install chromaprint.")
+        return {path: (None, None) for path in filepaths}
+    except ValueError as e:
+        logger.error(f"Failed to parse fpcalc output: {e}")
+    
+    for path in filepaths:
+        if path not in fingerprints:
+            fingerprints[path] = run_fpcalc(path)
+    return fingerprints
+
+_chromaprint = None
+_chromaprint_lock = threading.Lock()
+
+def load_chromaprint():
+    """Load libchromaprint through ctypes on first use. Returns None if it is not installed."""
+    global _chromaprint
+    with _chromaprint_lock:
+        if _chromaprint is None:
+            name = ctypes.util.find_library('chromaprint')
+            try:
+                lib = ctypes.CDLL(name) if name else None
+            except OSError as e:
+                logger.error(f"Failed to load libchromaprint: {e}")
+                lib = None
+            if lib is None:
+                logger.warning("libchromaprint not found, falling back to fpcalc")
+                _chromaprint = False
+                return None
+            lib.chromaprint_new.argtypes = [ctypes.c_int]
+            lib.chromaprint_new.restype = ctypes.c_void_p
+            lib.chromaprint_start.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+            lib.chromaprint_feed.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+            lib.chromaprint_finish.argtypes = [ctypes.c_void_p]
+            lib.chromaprint_get_fingerprint.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p)]
+            lib.chromaprint_dealloc.argtypes = [ctypes.c_void_p]
+            lib.chromaprint_free.argtypes = [ctypes.c_void_p]
+            _chromaprint = lib
+        return _chromaprint or None
+
+def decode_pcm_pyav(filepath):
+    """Yield signed 16-bit interleaved PCM chunks decoded in-process with PyAV."""
+    with av.open(filepath) as container:
+        resampler = av.AudioResampler(
+            format='s16',
+            layout='stereo' if CHROMAPRINT_CHANNELS == 2 else 'mono',
+            rate=CHROMAPRINT_SAMPLE_RATE
+        )
+        for frame in container.decode(audio=0):
+            frames = resampler.resample(frame)
+            # PyAV < 9 returns a single frame instead of a list
+            if not isinstance(frames, list):
+                frames = [frames] if frames is not None else []
+            for out in frames:
+                yield bytes(out.planes[0])[:out.samples * CHROMAPRINT_CHANNELS * 2]
+
+def decode_pcm_ffmpeg(filepath):
+    """Yield signed 16-bit interleaved PCM chunks from an ffmpeg pipe."""
+    cmd = [
+        'ffmpeg', '-v', 'error', '-i', filepath,
+        '-t', str(FINGERPRINT_LENGTH),
+        '-f', 's16le', '-ac', str(CHROMAPRINT_CHANNELS), '-ar', str(CHROMAPRINT_SAMPLE_RATE),
+        '-'
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for chunk in iter(lambda: process.stdout.read(1 << 16), b''):
+            yield chunk
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+def run_chromaprint(filepath, duration=None):
+    """Fingerprint in-process with libchromaprint.
+
+    Returns the same (fingerprint, duration) tuple as run_fpcalc; pass the
+    duration when it is already known from the parsed tags.
+    """
+    lib = load_chromaprint()
+    if lib is None:
+        return None, None
     
+    if av is not None:
+        decoder = decode_pcm_pyav
+        if not duration:
+            try:
+                with av.open(filepath) as container:
+                    duration = container.duration / av.time_base if container.duration else None
+            except Exception as e:
+                logger.debug(f"PyAV could not read duration of {filepath}: {e}")
+    else:
+        decoder = decode_pcm_ffmpeg
+    if not duration:
+        return None, None
+    
+    ctx = lib.chromaprint_new(1)  # CHROMAPRINT_ALGORITHM_DEFAULT
+    try:
+        if not lib.chromaprint_start(ctx, CHROMAPRINT_SAMPLE_RATE, CHROMAPRINT_CHANNELS):
+            raise RuntimeError("chromaprint_start failed")
+        remaining = FINGERPRINT_LENGTH * CHROMAPRINT_SAMPLE_RATE * CHROMAPRINT_CHANNELS
+        chunks = decoder(filepath)
+        try:
+            for chunk in chunks:
+                samples = min(len(chunk) // 2, remaining)
+                if not lib.chromaprint_feed(ctx, chunk[:samples * 2], samples):
+                    raise RuntimeError("chromaprint_feed failed")
+                remaining -= samples
+                if remaining <= 0:
+                    break
+        finally:
+            chunks.close()
+        if not lib.chromaprint_finish(ctx):
+            raise RuntimeError("chromaprint_finish failed")
+        pointer = ctypes.c_void_p()
+        if not lib.chromaprint_get_fingerprint(ctx, ctypes.byref(pointer)):
+            raise RuntimeError("chromaprint_get_fingerprint failed")
+        try:
+            fingerprint = ctypes.string_at(pointer).decode('ascii')
+        finally:
+            lib.chromaprint_dealloc(pointer)
+        return fingerprint, int(duration)
+    except Exception as e:
+        logger.error(f"In-process fingerprinting failed for {filepath}: {e}")
+        return None, None
+    finally:
+        lib.chromaprint_free(ctx)
+
+def compute_fingerprint(filepath, duration=None, pool=None):
+    """Fingerprint a file with the configured backend, falling back to fpcalc.
+
+    In-process fingerprinting runs in pool (a ProcessPoolExecutor) when
+    given, so batch runs decode on every core.
+    """
+    key = ('fingerprint', os.path.realpath(filepath))
+    return INFLIGHT.do(key, _compute_fingerprint, filepath, duration, pool)
+
+def _compute_fingerprint(filepath, duration, pool):
+    if FINGERPRINT_BACKEND == 'chromaprint':
+        if pool is not None:
+            fingerprint, duration = pool.submit(run_chromaprint, filepath, duration).result()
+        else:
+            fingerprint, duration = run_chromaprint(filepath, duration)
+        if fingerprint:
+            return fingerprint, duration
+    return run_fpcalc(filepath)
+
+def lookup_cached_fingerprint(track):
+    """Fill in a track's fingerprint from the cache. Returns True on a hit."""
+    try:
+        track.stat = os.stat(track.filepath)
+    except OSError as e:
+        logger.error(f"Cannot stat {track.filepath}: {e}")
+        return False
+
+    fingerprint, duration = get_cached_fingerprint(track.filepath, track.stat)
+    if not fingerprint and HASH_FILES:
+        try:
+            track.content_hash = hash_file(track.filepath)
+        except OSError as e:
+            logger.error(f"Failed to hash {track.filepath}: {e}")
+        else:
+            fingerprint, duration = get_cached_fingerprint(track.filepath, track.stat, track.content_hash)
+            if fingerprint:
+                # Same contents under a new identity; re-key it for next time
+                store_fingerprint(track.filepath, track.stat, fingerprint, duration, track.content_hash)
+    if not fingerprint:
+        return False
+    logger.info("Using cached fingerprint")
+    track.fingerprint, track.duration = fingerprint, duration
+    return True
+
+def fingerprint_tracks(tracks, pool=None):
+    """Fingerprint tracks that missed the cache and store the results.
+
+    With the fpcalc backend, several files share one fpcalc process.
+    """
+    if FINGERPRINT_BACKEND == 'fpcalc' and len(tracks) > 1:
+        fingerprints = run_fpcalc_batch([track.filepath for track in tracks])
+        for track in tracks:
+            track.fingerprint, track.duration = fingerprints[track.filepath]
+    else:
+        for track in tracks:
+            length = getattr(getattr(track.audio, 'info', None), 'length', None)
+            track.fingerprint, track.duration = compute_fingerprint(track.filepath, length, pool)
+    for track in tracks:
+        if track.fingerprint and track.duration and track.stat is not None:
+            store_fingerprint(track.filepath, track.stat, track.fingerprint, track.duration, track.content_hash)
+
+def query_acoustid(params):
+    """Send a lookup to AcoustID and return its results."""
+    params = dict(params, client=ACOUSTID_API_KEY, meta=ACOUSTID_META)
     url = f"{ACOUSTID_API_URL}?{urllib.parse.urlencode(params)}"
     
     try:
-        with urllib.request.urlopen(url, timeout=30) as response:
-            data = json.loads(response.read().decode())
-            if data.get('status') == 'ok':
-                return data.get('results', [])
-            else:
-                logger.error(f"AcoustID error: {data.get('error', {}).get('message')}")
-                return []
+        data = json.loads(http_request(url).decode())
+        if data.get('status') == 'ok':
+            return data.get('results', [])
+        else:
+            logger.error(f"AcoustID error: {data.get('error', {}).get('message')}")
+            return []
     except Exception as e:
         logger.error(f"Failed to query AcoustID: {e}")
         return []
 
-def get_cover_art_url(release_id):
-    """Get cover art URL from Cover Art Archive."""
-    time.sleep(1)
+def lookup_acoustid(fingerprint, duration):
+    """Look up fingerprint in AcoustID database."""
+    params = {'fingerprint': fingerprint, 'duration': str(duration)}
+    return INFLIGHT.do(('acoustid', fingerprint, duration), query_acoustid, params)
+
+def lookup_acoustid_trackid(trackid):
+    """Look up an AcoustID track id, such as one stored in an ACOUSTID_ID tag."""
+    return INFLIGHT.do(('acoustid', trackid), query_acoustid, {'trackid': trackid})
+
+def lookup_acoustid_batch(items):
+    """Look up several (fingerprint, duration) pairs in a single AcoustID request.
+
+    Returns one result list per item, in the same order. Identical
+    fingerprints (copies of the same file) are only sent once.
+    """
+    unique = list(dict.fromkeys(items))
+    if len(unique) < len(items):
+        unique_results = dict(zip(unique, lookup_acoustid_batch(unique)))
+        return [unique_results[item] for item in items]
+    
+    batch_results = [[] for _ in items]
+    if not items:
+        return batch_results
+    
+    params = [
+        ('client', ACOUSTID_API_KEY),
+        ('meta', ACOUSTID_META),
+        ('format', 'json'),
+    ]
+    for index, (fingerprint, duration) in enumerate(items):
+        params.append((f'fingerprint.{index}', fingerprint))
+        params.append((f'duration.{index}', str(duration)))
+    
+    # Fingerprints are large; the API accepts a gzip-compressed form body
+    body = gzip.compress(urllib.parse.urlencode(params).encode())
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Content-Encoding': 'gzip',
+    }
+    
+    try:
+        data = json.loads(http_request(ACOUSTID_API_URL, body, headers).decode())
+        if data.get('status') != 'ok':
+            logger.error(f"AcoustID error: {data.get('error', {}).get('message')}")
+            return batch_results
+        for entry in data.get('fingerprints', []):
+            index = int(entry.get('index', -1))
+            if 0 <= index < len(items):
+                batch_results[index] = entry.get('results', [])
+    except Exception as e:
+        logger.error(f"Failed to query AcoustID: {e}")
+    return batch_results
+
+def smallest_sufficient_thumbnail():
+    """Smallest CAA thumbnail size that satisfies MAX_IMAGE_EDGE, or None for the original."""
+    if not MAX_IMAGE_EDGE:
+        return None
+    for size in CAA_THUMBNAIL_SIZES:
+        if size >= MAX_IMAGE_EDGE:
+            return size
+    return None
+
+def pick_thumbnail(image):
+    """Choose the URL to download for a CAA image entry under the size policy."""
+    size = smallest_sufficient_thumbnail()
+    thumbnail = (image.get('thumbnails') or {}).get(str(size)) if size else None
+    return thumbnail or image.get('image')
+
+def query_cover_art_url(release_id):
+    """Ask Cover Art Archive for a release's cover art URL.
+
+    Returns (url, definitive); definitive is False when the answer came from
+    a transient error and must not be cached.
+    """
     url = f"{COVERARTARCHIVE_URL}/{release_id}"
     
     try:
-        with urllib.request.urlopen(url, timeout=30) as response:
-            data = json.loads(response.read().decode())
-            images = data.get('images', [])
-            
-            # Prefer front cover
-            for img in images:
-                if img.get('front'):
-                    return img.get('image')
-            
-            # Fallback to first image
-            if images:
-                return images[0].get('image')
-            
-            return None
+        data = json.loads(http_request(url).decode())
+        images = data.get('images', [])
+        
+        # Prefer front cover
+        for img in images:
+            if img.get('front'):
+                return pick_thumbnail(img), True
+        
+        # Fallback to first image
+        if images:
+            return pick_thumbnail(images[0]), True
+        
+        return None, True
     except urllib.error.HTTPError as e:
         if e.code == 404:
             logger.warning(f"No cover art found for release {release_id}")
-        else:
-            logger.error(f"HTTP error fetching cover art: {e}")
-        return None
+            return None, True
+        logger.error(f"HTTP error fetching cover art: {e}")
+        return None, False
     except Exception as e:
         logger.error(f"Failed to fetch cover art URL: {e}")
+        return None, False
+
+_release_art_memo = {}
+
+def get_cached_release_art(release_id):
+    """Return (found, url) for a release from the in-memory or persistent cache."""
+    now = time.time()
+    entry = _release_art_memo.get(release_id)
+    if entry is None:
+        db = get_cache_db()
+        if db is not None:
+            try:
+                with _cache_lock:
+                    entry = db.execute(
+                        'SELECT image_url, checked_at FROM release_art WHERE release_id = ?',
+                        (release_id,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Release cache lookup failed: {e}")
+        if entry is None:
+            return False, None
+        _release_art_memo[release_id] = entry
+    url, checked_at = entry
+    ttl = RELEASE_ART_TTL if url else NO_ART_TTL
+    if now - checked_at > ttl:
+        return False, None
+    return True, url
+
+def store_release_art(release_id, url):
+    """Remember a release's cover art URL, or None when it has no art."""
+    entry = (url, time.time())
+    _release_art_memo[release_id] = entry
+    db = get_cache_db()
+    if db is None:
+        return
+    try:
+        with _cache_lock, db:
+            db.execute(
+                'INSERT OR REPLACE INTO release_art (release_id, image_url, checked_at) VALUES (?, ?, ?)',
+                (release_id,) + entry
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Failed to store release art: {e}")
+
+def get_cover_art_url(release_id):
+    """Get cover art URL from Cover Art Archive, consulting the release cache first."""
+    # The chosen URL depends on the thumbnail policy, so cache it per size
+    size = smallest_sufficient_thumbnail()
+    key = f"{release_id}@{size}" if size else release_id
+    return INFLIGHT.do(('cover_art_url', key), _get_cover_art_url, release_id, key)
+
+def _get_cover_art_url(release_id, key):
+    found, url = get_cached_release_art(key)
+    if found:
+        if not url:
+            logger.info(f"Release {release_id} is known to have no cover art")
+        return url
+    
+    url, definitive = query_cover_art_url(release_id)
+    if definitive:
+        store_release_art(key, url)
+    return url
+
+def image_cache_path(sha256):
+    """Path of a cached image inside the content-addressed store."""
+    return os.path.join(CACHE_DIR, 'images', sha256[:2], sha256)
+
+def get_cached_image(url):
+    """Return cached image bytes for a URL, or None."""
+    db = get_cache_db()
+    if db is None:
+        return None
+    try:
+        with _cache_lock:
+            row = db.execute('SELECT sha256 FROM image_urls WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        with open(image_cache_path(row[0]), 'rb') as f:
+            image_data = f.read()
+        if hashlib.sha256(image_data).hexdigest() != row[0]:
+            logger.warning(f"Cached image for {url} is corrupt, ignoring it")
+            return None
+        with _cache_lock, db:
+            db.execute('UPDATE images SET last_used = ? WHERE sha256 = ?', (time.time(), row[0]))
+        return image_data
+    except (OSError, sqlite3.Error) as e:
+        logger.debug(f"Image cache miss for {url}: {e}")
         return None
 
+def store_cached_image(url, image_data):
+    """Add an image to the store and evict least recently used images over the size bound."""
+    db = get_cache_db()
+    if db is None or len(image_data) > IMAGE_CACHE_MAX_BYTES:
+        return
+    sha256 = hashlib.sha256(image_data).hexdigest()
+    path = image_cache_path(sha256)
+    try:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image_data)
+            os.replace(tmp_path, path)
+        with _cache_lock, db:
+            db.execute(
+                'INSERT OR REPLACE INTO images (sha256, size, last_used) VALUES (?, ?, ?)',
+                (sha256, len(image_data), time.time())
+            )
+            db.execute('INSERT OR REPLACE INTO image_urls (url, sha256) VALUES (?, ?)', (url, sha256))
+            total = db.execute('SELECT COALESCE(SUM(size), 0) FROM images').fetchone()[0]
+            evicted = []
+            if total > IMAGE_CACHE_MAX_BYTES:
+                for old_sha256, size in db.execute('SELECT sha256, size FROM images ORDER BY last_used'):
+                    if total <= IMAGE_CACHE_MAX_BYTES:
+                        break
+                    evicted.append(old_sha256)
+                    total -= size
+                for old_sha256 in evicted:
+                    db.execute('DELETE FROM images WHERE sha256 = ?', (old_sha256,))
+                    db.execute('DELETE FROM image_urls WHERE sha256 = ?', (old_sha256,))
+        for old_sha256 in evicted:
+            try:
+                os.remove(image_cache_path(old_sha256))
+            except OSError:
+                pass
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Failed to cache image: {e}")
+
+def fetch_image(url):
+    """Fetch image bytes, serving repeat URLs from the image cache. Raises on errors."""
+    return INFLIGHT.do(('image', url), _fetch_image, url)
+
+def _fetch_image(url):
+    image_data = get_cached_image(url)
+    if image_data:
+        logger.info("Using cached cover art image")
+        return image_data
+    image_data = http_request(url)
+    store_cached_image(url, image_data)
+    return image_data
+
 def download_image(url):
-    """Download image from URL."""
+    """Download image from URL, serving repeat URLs from the image cache."""
     try:
-        with urllib.request.urlopen(url, timeout=30) as response:
-            return response.read()
+        return fetch_image(url)
     except Exception as e:
         logger.error(f"Failed to download image: {e}")
         return None
 
-def embed_cover_art(filepath, image_data):
-    """Embed cover art into audio file."""
+def front_image_name():
+    """CAA front endpoint for CAA_FRONT_SIZE, shrunk to a smaller thumbnail if the size policy allows."""
+    size = CAA_FRONT_SIZE
+    if MAX_IMAGE_EDGE:
+        thumbnail = smallest_sufficient_thumbnail()
+        if thumbnail and (size == 'original' or int(size) > thumbnail):
+            size = str(thumbnail)
+    return 'front' if size == 'original' else f'front-{size}'
+
+def fetch_front_image(release_id):
+    """Download a release's front cover from CAA's sized front endpoint.
+
+    Returns (image_data, definitive) like query_cover_art_url; a 404 means
+    the release has no image flagged as front.
+    """
+    url = f"{COVERARTARCHIVE_URL}/{release_id}/{front_image_name()}"
+    try:
+        return fetch_image(url), True
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None, True
+        logger.error(f"HTTP error fetching front cover: {e}")
+        return None, False
+    except Exception as e:
+        logger.error(f"Failed to fetch front cover: {e}")
+        return None, False
+
+def front_image_exists(release_id):
+    """Ask CAA's front endpoint whether a release has a front image without downloading it.
+
+    Returns (exists, definitive) like fetch_front_image.
+    """
+    url = f"{COVERARTARCHIVE_URL}/{release_id}/{front_image_name()}"
+    try:
+        status, reason, _, _ = HTTP_POOL.request('HEAD', url)
+    except Exception as e:
+        logger.error(f"Failed to check front cover: {e}")
+        return False, False
+    if status == 404:
+        return False, True
+    if status >= 400:
+        logger.error(f"HTTP error checking front cover: {status} {reason}")
+        return False, False
+    return True, True
+
+def probe_front_image(release_id, key):
+    """front_image_exists with the answer stored in the release cache under key. Returns exists."""
+    return INFLIGHT.do(('front_probe', key), _probe_front_image, release_id, key)
+
+def _probe_front_image(release_id, key):
+    exists, definitive = front_image_exists(release_id)
+    if definitive:
+        store_release_art(key, 'front' if exists else None)
+    return exists
+
+def locate_release_cover(release_id, download=True):
+    """Find out whether a release has cover art.
+
+    Returns (cover_url, image_data). With CAA_DIRECT the sized front image
+    is requested straight away, so image_data is already downloaded; the
+    JSON listing is only consulted when the release has no front image,
+    and then only its URL is returned. (None, None) means no art.
+
+    Without download, CAA_DIRECT only checks that the front image exists
+    and returns its URL, so probing many candidates downloads nothing.
+    """
+    if CAA_DIRECT:
+        # Cached under its own key so a missing front does not hide the listing
+        key = f"{release_id}/{front_image_name()}"
+        found, url = get_cached_release_art(key)
+        if not download and (not found or url):
+            front_url = f"{COVERARTARCHIVE_URL}/{key}"
+            if found:
+                return front_url, None
+            if probe_front_image(release_id, key):
+                return front_url, None
+        elif not found or url:
+            image_data, definitive = fetch_front_image(release_id)
+            if image_data:
+                if not found:
+                    store_release_art(key, 'front')
+                logger.info(f"Downloaded front cover ({len(image_data)} bytes)")
+                return key, image_data
+            if definitive:
+                store_release_art(key, None)
+    
+    # Get cover art URL
+    cover_url = get_cover_art_url(release_id)
+    if cover_url:
+        logger.info(f"Found cover art URL: {cover_url}")
+    return cover_url, None
+
+def fetch_release_cover(release_id):
+    """Download cover art for a release. Returns image bytes or None."""
+    cover_url, image_data = locate_release_cover(release_id)
+    if image_data or not cover_url:
+        return image_data
+    
+    # Download image
+    image_data = download_image(cover_url)
+    if image_data:
+        logger.info(f"Downloaded cover art ({len(image_data)} bytes)")
+    return image_data
+
+def image_mime_type(image_data):
+    """Guess an image's MIME type from its signature, defaulting to JPEG."""
+    if image_data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    return 'image/jpeg'
+
+def write_tags(audio, values):
+    """Set TAG_NAMES text tags on a parsed file without saving it."""
+    if audio.tags is None:
+        audio.add_tags()
+    tags = audio.tags
+    for name, value in values.items():
+        id3_key, mp4_key, vorbis_key = TAG_NAMES[name]
+        if isinstance(tags, ID3):
+            frame_id, _, desc = id3_key.partition(':')
+            tags.delall(id3_key)
+            if frame_id == 'UFID':
+                tags.add(UFID(owner=desc, data=value.encode()))
+            else:
+                tags.add(TXXX(encoding=3, desc=desc, text=[value]))
+        elif isinstance(audio, MP4):
+            tags[mp4_key] = [MP4FreeForm(value.encode())]
+        else:
+            tags[vorbis_key] = [value]
+
+_pillow_warned = False
+
+def apply_image_policy(image_data, max_edge=None, max_bytes=None):
+    """Downsize and re-encode an image larger than max_edge pixels or max_bytes.
+
+    Returns the image unchanged when it already fits or Pillow is missing.
+    Limits are passed explicitly so this can run in a worker process.
+    """
+    global _pillow_warned
+    if not max_edge and not max_bytes:
+        return image_data
+    if Image is None:
+        if not _pillow_warned:
+            logger.warning("Pillow is not installed, images are embedded at their original size")
+            _pillow_warned = True
+        return image_data
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            too_wide = max_edge and max(image.size) > max_edge
+            if not too_wide and not (max_bytes and len(image_data) > max_bytes):
+                return image_data
+            image = image.convert('RGB')
+            if too_wide:
+                image.thumbnail((max_edge, max_edge), getattr(Image, 'Resampling', Image).LANCZOS)
+            for quality in (90, 80, 70, 60, 50):
+                output = io.BytesIO()
+                image.save(output, 'JPEG', quality=quality, optimize=True)
+                if not max_bytes or output.tell() <= max_bytes:
+                    break
+        resized = output.getvalue()
+        logger.info(f"Resized cover art from {len(image_data)} to {len(resized)} bytes")
+        return resized
+    except Exception as e:
+        logger.error(f"Failed to resize cover art: {e}")
+        return image_data
+
+def embed_cover_art(filepath, image_data, audio=None, tag_values=None):
+    """Embed cover art into audio file, reusing an already parsed mutagen object if given.
+
+    tag_values (see write_tags) are written in the same save.
+    """
     try:
-        audio = MutagenFile(filepath)
+        if audio is None:
+            audio = MutagenFile(filepath)
         
         if audio is None:
             logger.error("Unsupported file format")
             return False
         
+        mime = image_mime_type(image_data)
+        
         # Handle different file formats
         if isinstance(audio, MP4):
             # MP4/M4A
-            audio.tags['covr'] = [MP4Cover(image_data, imageformat=MP4Cover.FORMAT_JPEG)]
+            if audio.tags is None:
+                audio.add_tags()
+            imageformat = MP4Cover.FORMAT_PNG if mime == 'image/png' else MP4Cover.FORMAT_JPEG
+            audio.tags['covr'] = [MP4Cover(image_data, imageformat=imageformat)]
         elif isinstance(audio, FLAC):
             # FLAC
             picture = Picture()
             picture.type = 3  # Cover (front)
-            picture.mime = 'image/jpeg'
+            picture.mime = mime
             picture.data = image_data
             audio.clear_pictures()
             audio.add_picture(picture)
@@ -152,13 +1294,16 @@ def embed_cover_art(filepath, image_data):
             audio.tags.add(
                 APIC(
                     encoding=3,  # UTF-8
-                    mime='image/jpeg',
+                    mime=mime,
                     type=3,  # Cover (front)
                     desc='Cover',
                     data=image_data
                 )
             )
         
+        if tag_values:
+            write_tags(audio, tag_values)
+        
         audio.save()
         logger.info(f"Successfully embedded cover art in {filepath}")
         return True
@@ -167,7 +1312,46 @@ def embed_cover_art(filepath, image_data):
         logger.error(f"Failed to embed cover art: {e}")
         return False
 
-def has_cover_art(filepath):
+def audio_has_picture(audio):
+    """Check a parsed mutagen file for an embedded picture."""
+    if isinstance(audio, FLAC) and audio.pictures:
+        return True
+    tags = audio.tags
+    if tags is None:
+        return False
+    if isinstance(tags, ID3):
+        return bool(tags.getall('APIC'))
+    return any(key in tags for key in PICTURE_TAG_KEYS)
+
+def extract_cover_art(audio):
+    """Return the embedded picture of a parsed mutagen file, preferring the front cover."""
+    if audio is None:
+        return None
+    if isinstance(audio, FLAC) and audio.pictures:
+        pictures = audio.pictures
+    else:
+        tags = audio.tags
+        if tags is None:
+            return None
+        if isinstance(tags, ID3):
+            pictures = tags.getall('APIC')
+        elif 'covr' in tags:
+            return bytes(tags['covr'][0]) if tags['covr'] else None
+        elif 'metadata_block_picture' in tags:
+            pictures = []
+            for value in tags['metadata_block_picture']:
+                try:
+                    pictures.append(Picture(base64.b64decode(value)))
+                except Exception as e:
+                    logger.debug(f"Skipping unreadable METADATA_BLOCK_PICTURE: {e}")
+        else:
+            return None
+    for picture in pictures:
+        if picture.type == 3:  # Cover (front)
+            return picture.data
+    return pictures[0].data if pictures else None
+
+def has_cover_art_ffprobe(filepath):
     """Check if file has embedded cover art using ffprobe."""
     cmd = [
         'ffprobe', 
@@ -188,82 +1372,1188 @@ def has_cover_art(filepath):
         logger.error(f"Error checking cover art: {e}")
         return False
 
-def process_file(filepath):
-    """Process a single audio file."""
-    logger.info(f"Processing {filepath}...")
+def load_audio(filepath):
+    """Parse a file's tags and stream info with mutagen. Returns None if it cannot."""
+    try:
+        return MutagenFile(filepath)
+    except Exception as e:
+        logger.debug(f"mutagen could not read {filepath}: {e}")
+        return None
+
+def read_tag(audio, name):
+    """Read the first value of a TAG_NAMES text tag, whatever the tagging scheme."""
+    tags = getattr(audio, 'tags', None)
+    if tags is None:
+        return None
+    id3_key, mp4_key, vorbis_key = TAG_NAMES[name]
+    if isinstance(tags, ID3):
+        frames = tags.getall(id3_key)
+        if frames and not hasattr(frames[0], 'text'):
+            # UFID frames hold a single binary identifier
+            values = [frames[0].data]
+        else:
+            values = frames[0].text if frames else []
+    elif isinstance(audio, MP4):
+        values = tags.get(mp4_key, [])
+    else:
+        values = tags.get(vorbis_key, [])
+    if not values:
+        return None
+    value = values[0]
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    return str(value).strip() or None
+
+_local_art_memo = collections.OrderedDict()
+_local_art_lock = threading.Lock()
+
+def scan_local_art(directory, parsed=None):
+    """Collect a directory's folder image and its audio files' embedded art.
+
+    parsed maps paths to audio objects already loaded by the caller, so
+    those files are not read a second time. Returns (folder_image, {album: image}); files without an album tag are
+    left out, since nothing ties their art to any other file.
+    """
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError as e:
+        logger.debug(f"Cannot list {directory}: {e}")
+        return None, {}
     
-    # Check if file already has cover art
-    if has_cover_art(filepath):
-        logger.info("File already has cover art. Skipping.")
-        return True
+    folder_image = None
+    by_lower = {name.lower(): name for name in names}
+    for candidate in FOLDER_IMAGE_NAMES:
+        name = by_lower.get(candidate.lower())
+        if not name:
+            continue
+        try:
+            with open(os.path.join(directory, name), 'rb') as f:
+                folder_image = f.read()
+            break
+        except OSError as e:
+            logger.debug(f"Cannot read {name}: {e}")
     
-    logger.info("No cover art found. Analyzing with AcoustID...")
+    album_art = {}
+    for name in names:
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        filepath = os.path.join(directory, name)
+        if parsed and filepath in parsed:
+            audio = parsed[filepath]
+        else:
+            audio = load_audio(filepath)
+        if audio is None or not audio_has_picture(audio):
+            continue
+        album = read_tag(audio, 'album')
+        if album is not None and album not in album_art:
+            image_data = extract_cover_art(audio)
+            if image_data:
+                album_art[album] = image_data
+    return folder_image, album_art
+
+def find_local_cover_art(track, parsed=None):
+    """Find art for a track in its folder without touching the network.
+
+    Uses a folder image if present, otherwise embedded art from a sibling
+    with the same album tag. Tracks without an album tag only get a folder
+    image, so loose singles never borrow another album's cover.
+    """
+    directory = os.path.dirname(track.filepath)
+    with _local_art_lock:
+        local = _local_art_memo.get(directory)
+        if local is not None:
+            _local_art_memo.move_to_end(directory)
+    if local is None:
+        local = scan_local_art(directory, parsed)
+        with _local_art_lock:
+            _local_art_memo[directory] = local
+            while len(_local_art_memo) > LOCAL_ART_MEMO_SIZE:
+                _local_art_memo.popitem(last=False)
     
-    # Generate fingerprint
-    fingerprint, duration = run_fpcalc(filepath)
-    if not fingerprint or not duration:
-        logger.error("Failed to generate fingerprint")
+    folder_image, album_art = local
+    if folder_image:
+        logger.info(f"Using folder image for {track.filepath}")
+        return folder_image
+    image_data = album_art.get(read_tag(track.audio, 'album'))
+    if image_data:
+        logger.info(f"Using cover art embedded in a sibling of {track.filepath}")
+    return image_data
+
+def fetch_tagged_cover_art(track):
+    """Fetch cover art for the MusicBrainz release check_file found in the track's tags, if any."""
+    release_id = track.tagged_release
+    track.tagged_release = None
+    if not release_id:
+        return None
+    logger.info(f"Using tagged MusicBrainz release {release_id}")
+    image_data = fetch_release_cover(release_id)
+    if image_data:
+        track.identifiers = {'musicbrainz_albumid': release_id}
+    return image_data
+
+def read_tagged_acoustid(track):
+    """Take an AcoustID track id and fingerprint from the track's tags instead of decoding it.
+
+    A stored ACOUSTID_ID goes to track.tagged_trackid, to be resolved in
+    the lookup stage; a stored ACOUSTID_FINGERPRINT fills in the
+    fingerprint. Returns True if either was found.
+    """
+    track.tagged_trackid = read_tag(track.audio, 'acoustid_id')
+    fingerprint = read_tag(track.audio, 'acoustid_fingerprint')
+    length = getattr(getattr(track.audio, 'info', None), 'length', None)
+    if fingerprint and length:
+        logger.info("Using tagged AcoustID fingerprint")
+        track.fingerprint, track.duration = fingerprint, int(length)
+    return bool(track.tagged_trackid or track.fingerprint)
+
+def resolve_tagged_trackid(track):
+    """Look up the track's tagged AcoustID track id. Returns True if it gave results."""
+    trackid = track.tagged_trackid
+    track.tagged_trackid = None
+    if not trackid:
+        return False
+    results = lookup_acoustid_trackid(trackid)
+    if not results:
+        return False
+    logger.info(f"Using tagged AcoustID track {trackid}")
+    track.results = results
+    return True
+
+def has_cover_art(filepath, audio=None):
+    """Check if file has embedded cover art by reading its tags in-process."""
+    if audio is None:
+        audio = load_audio(filepath)
+    if audio is None:
+        if FFPROBE_FALLBACK:
+            return has_cover_art_ffprobe(filepath)
         return False
+    return audio_has_picture(audio)
+
+class Track:
+    """One file's state as it moves through the processing stages.
+
+    The parsed mutagen object is kept so tags are read once per file and
+    the same object is written back when embedding.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.audio = None
+        self.fingerprint = None
+        self.duration = None
+        self.stat = None
+        self.content_hash = None
+        self.checked = False
+        self.results = None
+        self.image_data = None
+        self.identifiers = {}
+        self.tagged_release = None
+        self.tagged_trackid = None
+
+def check_file(track, parsed=None):
+    """Load the file's tags, check for existing art and look for a cached fingerprint.
+
+    Returns SKIPPED when the file already has art, otherwise None. Art
+    found locally is left in track.image_data, ready to embed, a tagged
+    MusicBrainz release id in track.tagged_release, ready to fetch, and a
+    tagged AcoustID id in track.tagged_trackid, ready to look up. parsed maps paths to audio objects already loaded for the track's
+    siblings.
+    """
+    track.checked = True
+    logger.info(f"Processing {track.filepath}...")
+    
+    # Check if file already has cover art
+    if track.audio is None:
+        track.audio = load_audio(track.filepath)
+    if has_cover_art(track.filepath, track.audio):
+        logger.info("File already has cover art. Skipping.")
+        return SKIPPED
+    
+    if LOCAL_ART:
+        track.image_data = find_local_cover_art(track, parsed)
+        if track.image_data:
+            return None
     
-    logger.info(f"Fingerprint generated (duration: {duration}s)")
+    if USE_TAGS:
+        # The release itself is fetched in the fetch stage
+        track.tagged_release = read_tag(track.audio, 'musicbrainz_albumid')
+        read_tagged_acoustid(track)
+        if track.tagged_release:
+            return None
     
-    # Lookup in AcoustID
-    results = lookup_acoustid(fingerprint, duration)
-    if not results:
-        logger.error("No AcoustID results found")
+    logger.info("No cover art found. Analyzing with AcoustID...")
+    if not track.fingerprint:
+        lookup_cached_fingerprint(track)
+    return None
+
+def parse_tracks(tracks):
+    """Load every track's tags up front so a local art scan of their folder can reuse them.
+
+    Returns {path: audio} for the tracks.
+    """
+    for track in tracks:
+        if track.audio is None:
+            track.audio = load_audio(track.filepath)
+    return {track.filepath: track.audio for track in tracks}
+
+def ready_to_fetch(track):
+    """True when a track can skip fingerprinting and the AcoustID lookup."""
+    return bool(track.image_data or track.tagged_release or track.results is not None)
+
+def needs_fingerprint(track):
+    """True when a track has to be fingerprinted before its AcoustID lookup."""
+    return not (track.fingerprint or track.tagged_trackid or ready_to_fetch(track))
+
+def identify_track(track, pool=None):
+    """Fill in AcoustID results for a track that reached the fetch stage without any.
+
+    That happens when its tagged release had no art or its tagged AcoustID
+    id gave no results; the fingerprint and lookup work is done inline.
+    Returns False if the track could not be fingerprinted.
+    """
+    if resolve_tagged_trackid(track):
+        return True
+    if not track.fingerprint and not lookup_cached_fingerprint(track):
+        fingerprint_tracks([track], pool)
+    if not track.fingerprint or not track.duration:
+        logger.error(f"Failed to generate fingerprint for {track.filepath}")
         return False
+    track.results = lookup_acoustid(track.fingerprint, track.duration)
+    return True
+
+def prepare_tracks(tracks, pool=None):
+    """Check and fingerprint several files, sharing fpcalc runs between cache misses.
+
+    Returns one status per track: SKIPPED or FAILED when the file is done,
+    or None when it still needs an AcoustID lookup (of its fingerprint or
+    tagged_trackid), or, with results or tagged_release set, only fetching,
+    or with image_data set, only embedding.
+    """
+    parsed = parse_tracks([track for track in tracks if not track.checked])
+    statuses = [None if track.checked else check_file(track, parsed) for track in tracks]
     
-    logger.info(f"Found {len(results)} AcoustID result(s)")
+    # Generate fingerprints
+    fingerprint_tracks(
+        [track for track, status in zip(tracks, statuses)
+         if status is None and needs_fingerprint(track)],
+        pool
+    )
     
-    # Try each result until we find cover art
+    for index, track in enumerate(tracks):
+        if statuses[index] or ready_to_fetch(track) or track.tagged_trackid:
+            continue
+        if not track.fingerprint or not track.duration:
+            logger.error(f"Failed to generate fingerprint for {track.filepath}")
+            statuses[index] = FAILED
+        else:
+            logger.info(f"Fingerprint generated for {track.filepath} (duration: {track.duration}s)")
+    return statuses
+
+def prepare_file(track, pool=None):
+    """Check for existing art and fingerprint the file.
+
+    Returns SKIPPED or FAILED when the file is done, or None when it still
+    needs an AcoustID lookup.
+    """
+    return prepare_tracks([track], pool)[0]
+
+def iter_candidate_releases(results):
+    """Yield (result, recording, release, releasegroup) for every release in AcoustID results.
+
+    Handles releases nested under release groups (when the lookup asks for
+    releasegroups) as well as directly under recordings; releasegroup is
+    None for the latter.
+    """
     for result in results:
-        recordings = result.get('recordings', [])
-        if not recordings:
+        for recording in result.get('recordings', []):
+            for release in recording.get('releases', []):
+                yield result, recording, release, None
+            for releasegroup in recording.get('releasegroups', []):
+                for release in releasegroup.get('releases', []):
+                    yield result, recording, release, releasegroup
+
+_directory_releases = collections.OrderedDict()
+_directory_releases_lock = threading.Lock()
+
+def remember_directory_release(directory, release_id):
+    """Record the release a file in this directory was resolved to."""
+    with _directory_releases_lock:
+        counts = _directory_releases.setdefault(directory, collections.Counter())
+        counts[release_id] += 1
+        _directory_releases.move_to_end(directory)
+        while len(_directory_releases) > DIRECTORY_RELEASES_MEMO_SIZE:
+            _directory_releases.popitem(last=False)
+
+def rank_releases(results, directory=None):
+    """Order the candidate releases in AcoustID results, most likely first.
+
+    Returns a list of (release, identifiers). Each release is scored on its
+    best AcoustID match score, how many recordings it appears under, its
+    release group type (albums before singles, compilations and live
+    releases last) and how often siblings in the same directory resolved
+    to it.
+    """
+    with _directory_releases_lock:
+        siblings = dict(_directory_releases.get(directory, {}))
+    sibling_total = sum(siblings.values())
+    
+    candidates = {}
+    for result, recording, release, releasegroup in iter_candidate_releases(results):
+        release_id = release.get('id')
+        if not release_id:
+            continue
+        candidate = candidates.get(release_id)
+        if candidate is None:
+            candidate = candidates[release_id] = {
+                'release': release,
+                'score': 0.0,
+                'recordings': set(),
+                'releasegroup': releasegroup,
+                'identifiers': {
+                    'acoustid_id': result.get('id'),
+                    'musicbrainz_recordingid': recording.get('id'),
+                    'musicbrainz_albumid': release_id,
+                },
+            }
+        if candidate['releasegroup'] is None:
+            candidate['releasegroup'] = releasegroup
+        candidate['score'] = max(candidate['score'], float(result.get('score', 0)))
+        candidate['recordings'].add(recording.get('id'))
+    if not candidates:
+        return []
+    
+    most_recordings = max(len(c['recordings']) for c in candidates.values())
+    
+    def rank(release_id):
+        candidate = candidates[release_id]
+        releasegroup = candidate['releasegroup'] or {}
+        type_score = RELEASE_TYPE_BONUS.get(releasegroup.get('type'), 0.0)
+        type_score -= sum(SECONDARY_TYPE_PENALTY.get(t, 0.0) for t in releasegroup.get('secondarytypes', []))
+        sibling_score = siblings.get(release_id, 0) / sibling_total if sibling_total else 0.0
+        return (
+            RANK_WEIGHTS['score'] * candidate['score']
+            + RANK_WEIGHTS['frequency'] * len(candidate['recordings']) / most_recordings
+            + RANK_WEIGHTS['type'] * type_score
+            + RANK_WEIGHTS['siblings'] * sibling_score
+        )
+    
+    # sorted() is stable, so ties keep AcoustID's order
+    ordered = sorted(candidates, key=rank, reverse=True)
+    return [
+        (candidates[release_id]['release'],
+         {name: value for name, value in candidates[release_id]['identifiers'].items() if value})
+        for release_id in ordered
+    ]
+
+def find_cover_art(results, directory=None):
+    """Try the ranked releases from the AcoustID results until a cover image downloads.
+
+    At most MAX_CANDIDATES releases are tried. Returns (image_data,
+    identifiers), identifiers naming the AcoustID track, recording and
+    release the image came from.
+    """
+    candidates = rank_releases(results, directory)[:MAX_CANDIDATES]
+    if PROBE_CONCURRENCY > 1 and len(candidates) > 1:
+        return probe_cover_art(candidates, directory)
+    
+    for release, identifiers in candidates:
+        release_id = identifiers['musicbrainz_albumid']
+        logger.info(f"Trying release: {release.get('title', 'Unknown')} ({release_id})")
+        
+        image_data = fetch_release_cover(release_id)
+        if image_data:
+            if directory:
+                remember_directory_release(directory, release_id)
+            return image_data, identifiers
+    
+    return None, None
+
+_probe_executor = None
+_probe_executor_lock = threading.Lock()
+
+def get_probe_executor():
+    """Thread pool shared by all concurrent candidate probes."""
+    global _probe_executor
+    with _probe_executor_lock:
+        if _probe_executor is None:
+            _probe_executor = ThreadPoolExecutor(
+                max_workers=PROBE_CONCURRENCY * STAGE_WORKERS['fetch'],
+                thread_name_prefix='probe'
+            )
+        return _probe_executor
+
+def probe_cover_art(candidates, directory=None):
+    """find_cover_art with the next PROBE_CONCURRENCY candidates probed at once.
+
+    Answers are still taken in rank order: the best-ranked candidate with
+    art wins, and probes of lower-ranked candidates that have not started
+    yet are cancelled. Probes only locate the art; just the winner's image
+    is downloaded.
+    """
+    executor = get_probe_executor()
+    futures = []
+    
+    def submit_until(limit):
+        while len(futures) < min(limit, len(candidates)):
+            release, identifiers = candidates[len(futures)]
+            release_id = identifiers['musicbrainz_albumid']
+            logger.info(f"Probing release: {release.get('title', 'Unknown')} ({release_id})")
+            futures.append(executor.submit(locate_release_cover, release_id, False))
+    
+    for index, (release, identifiers) in enumerate(candidates):
+        submit_until(index + PROBE_CONCURRENCY)
+        release_id = identifiers['musicbrainz_albumid']
+        try:
+            cover_url, image_data = futures[index].result()
+        except concurrent.futures.CancelledError:
+            cover_url, image_data = locate_release_cover(release_id, False)
+        except Exception as e:
+            logger.error(f"Probe of release {release_id} failed: {e}")
+            continue
+        if not cover_url and not image_data:
             continue
         
-        for recording in recordings:
-            releases = recording.get('releases', [])
-            if not releases:
+        for future in futures[index + 1:]:
+            future.cancel()
+        if not image_data:
+            image_data = download_image(cover_url)
+            if not image_data:
                 continue
-            
-            for release in releases:
-                release_id = release.get('id')
-                if not release_id:
-                    continue
-                
-                logger.info(f"Trying release: {release.get('title', 'Unknown')} ({release_id})")
-                
-                # Get cover art URL
-                cover_url = get_cover_art_url(release_id)
-                if not cover_url:
-                    continue
-                
-                logger.info(f"Found cover art URL: {cover_url}")
-                
-                # Download image
-                image_data = download_image(cover_url)
-                if not image_data:
-                    continue
-                
-                logger.info(f"Downloaded cover art ({len(image_data)} bytes)")
-                
-                # Embed cover art
-                if embed_cover_art(filepath, image_data):
-                    logger.info("Successfully added cover art!")
-                    return True
-    
-    logger.warning("No cover art could be found or embedded")
+            logger.info(f"Downloaded cover art ({len(image_data)} bytes)")
+        if directory:
+            remember_directory_release(directory, release_id)
+        return image_data, identifiers
+    
+    return None, None
+
+def fetch_cover_art(track, pool=None):
+    """Find and download cover art for a track: its tagged release, then its AcoustID results."""
+    if track.tagged_release:
+        track.image_data = fetch_tagged_cover_art(track)
+        if track.image_data:
+            return track.image_data
+    if track.results is None and not identify_track(track, pool):
+        return None
+    
+    if not track.results:
+        logger.error(f"No AcoustID results found for {track.filepath}")
+        return None
+    
+    logger.info(f"Found {len(track.results)} AcoustID result(s) for {track.filepath}")
+    track.image_data, identifiers = find_cover_art(track.results, os.path.dirname(track.filepath))
+    if not track.image_data:
+        logger.warning(f"No cover art could be found for {track.filepath}")
+        return None
+    track.identifiers = identifiers
+    return track.image_data
+
+def embed_track(track):
+    """Embed a track's image_data, plus its identifiers when WRITE_TAGS is set."""
+    tag_values = None
+    if WRITE_TAGS:
+        tag_values = dict(track.identifiers)
+        if track.fingerprint:
+            tag_values['acoustid_fingerprint'] = track.fingerprint
+    if embed_cover_art(track.filepath, track.image_data, track.audio, tag_values):
+        logger.info("Successfully added cover art!")
+        return True
     return False
 
+_release_tracks_memo = {}
+
+def get_release_track_lengths(release_id):
+    """Fetch a release's track lengths in seconds from MusicBrainz, one list per medium.
+
+    Unknown lengths are None. Returns None if the release cannot be fetched.
+    """
+    if release_id in _release_tracks_memo:
+        return _release_tracks_memo[release_id]
+    return INFLIGHT.do(('release_tracks', release_id), _get_release_track_lengths, release_id)
+
+def _get_release_track_lengths(release_id):
+    url = f"{MUSICBRAINZ_API_URL}/release/{release_id}?inc=recordings&fmt=json"
+    try:
+        data = json.loads(http_request(url).decode())
+    except Exception as e:
+        logger.error(f"Failed to fetch tracklist for release {release_id}: {e}")
+        return None
+    media = []
+    for medium in data.get('media', []):
+        lengths = []
+        for track in medium.get('tracks', []):
+            length = track.get('length') or track.get('recording', {}).get('length')
+            lengths.append(length / 1000 if length else None)
+        media.append(lengths)
+    _release_tracks_memo[release_id] = media
+    return media
+
+def folder_tracklists(media, folder_size):
+    """Tracklists of a release that a folder of folder_size files could hold.
+
+    That is the whole release, or a single medium for the common
+    one-folder-per-disc layout.
+    """
+    whole = [length for lengths in media for length in lengths]
+    candidates = [whole] + (media if len(media) > 1 else [])
+    return [lengths for lengths in candidates if len(lengths) == folder_size]
+
+def match_track_durations(tracks, lengths):
+    """Return the tracks whose duration fits an unused track length of a release."""
+    unused = [length for length in lengths if length]
+    matched = []
+    for track in tracks:
+        length = getattr(getattr(track.audio, 'info', None), 'length', None)
+        if not length or not unused:
+            continue
+        closest = min(unused, key=lambda candidate: abs(candidate - length))
+        if abs(closest - length) <= ALBUM_DURATION_TOLERANCE:
+            unused.remove(closest)
+            matched.append(track)
+    return matched
+
+def album_release_candidates(samples):
+    """Release ids from the samples' AcoustID results, those shared by most samples first."""
+    counts = {}
+    for track in samples:
+        seen = set()
+        for _, _, release, _ in iter_candidate_releases(track.results or []):
+            if release.get('id'):
+                seen.add(release['id'])
+        for release_id in seen:
+            counts[release_id] = counts.get(release_id, 0) + 1
+    # sorted() is stable, so ties keep AcoustID's order
+    return sorted(counts, key=lambda release_id: -counts[release_id])
+
+def count_audio_files(directory):
+    """Number of audio files directly in a directory, or None if it cannot be listed."""
+    try:
+        return sum(1 for name in os.listdir(directory) if name.lower().endswith(AUDIO_EXTENSIONS))
+    except OSError as e:
+        logger.error(f"Cannot list {directory}: {e}")
+        return None
+
+def resolve_album(tracks, pool=None):
+    """Identify one directory's release and prepare its cover for every sibling that fits.
+
+    tracks are audio files of one directory, possibly only some of them
+    (--incremental, --resume or an explicit file list). A few of the ones
+    missing art are fingerprinted and looked up; the first candidate
+    release which, as a whole or in one of its media, has as many tracks
+    as the folder has audio files and whose track lengths fit is used for
+    every matching sibling.
+
+    Returns (done, ready, remaining): (track, status) pairs that are
+    finished, tracks with image_data ready to embed, and tracks that need
+    the per-track path.
+    """
+    parsed = parse_tracks(tracks)
+    statuses = [check_file(track, parsed) for track in tracks]
+    done = [(track, status) for track, status in zip(tracks, statuses) if status]
+    local = [track for track, status in zip(tracks, statuses) if not status and track.image_data]
+    # Tracks tagged with their release go straight to the fetch stage
+    unfound = [track for track, status in zip(tracks, statuses) if not status and not track.image_data]
+    tagged = [track for track in unfound if track.tagged_release]
+    missing = [track for track in unfound if not track.tagged_release]
+    if len(missing) < 2:
+        return done, local, tagged + missing
+    
+    # Spread the samples across the folder
+    step = max(1, len(missing) // ALBUM_SAMPLE_TRACKS)
+    samples = missing[::step][:ALBUM_SAMPLE_TRACKS]
+    fingerprint_tracks([track for track in samples if not track.fingerprint], pool)
+    samples = [track for track in samples if track.fingerprint and track.duration]
+    if not samples:
+        return done, local, tagged + missing
+    for track, results in zip(samples, lookup_acoustid_batch([(t.fingerprint, t.duration) for t in samples])):
+        track.results = results
+    
+    directory = os.path.dirname(tracks[0].filepath)
+    folder_size = count_audio_files(directory) or len(tracks)
+    for release_id in album_release_candidates(samples)[:ALBUM_MAX_CANDIDATES]:
+        media = get_release_track_lengths(release_id)
+        if not media:
+            continue
+        matched = max(
+            (match_track_durations(missing, lengths) for lengths in folder_tracklists(media, folder_size)),
+            key=len, default=[]
+        )
+        if not matched:
+            continue
+        image_data = fetch_release_cover(release_id)
+        if not image_data:
+            continue
+        logger.info(f"Album release {release_id} fits {len(matched)} of {len(missing)} file(s) in {directory}")
+        remember_directory_release(directory, release_id)
+        for track in matched:
+            track.image_data = image_data
+            track.identifiers = {'musicbrainz_albumid': release_id}
+        return done, local + matched, tagged + [track for track in missing if track not in matched]
+    
+    logger.info(f"No release matched the folder {directory}, falling back to per-track lookups")
+    return done, local, tagged + missing
+
+def group_by_directory(filepaths):
+    """Group consecutive paths that share a directory, as find_audio_files yields them."""
+    group = []
+    for filepath in filepaths:
+        if group and os.path.dirname(group[0]) != os.path.dirname(filepath):
+            yield group
+            group = []
+        group.append(filepath)
+    if group:
+        yield group
+
+def process_file(filepath):
+    """Process a single audio file. Returns SUCCESS, SKIPPED or FAILED."""
+    track = Track(filepath)
+    status = prepare_file(track)
+    if status:
+        return status
+    
+    # Lookup in AcoustID happens in fetch_cover_art when needed
+    if not track.image_data and not fetch_cover_art(track):
+        return FAILED
+    
+    # Embed cover art
+    track.image_data = apply_image_policy(track.image_data, MAX_IMAGE_EDGE, MAX_IMAGE_BYTES)
+    return SUCCESS if embed_track(track) else FAILED
+
+async def run_pipeline(filepaths, report):
+    """Process files through bounded, concurrent stages.
+
+    [album ->] fingerprint -> lookup -> fetch [-> resize] -> embed. Each
+    stage has its own queue of QUEUE_SIZE items and STAGE_WORKERS workers;
+    blocking work runs in a thread pool. The album stage only runs in
+    ALBUM_MODE, taking whole directories, and the resize stage only with an
+    image size policy. Calls report(filepath, status, stage) as each file
+    finishes, stage being the one it finished in.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=sum(STAGE_WORKERS.values()) + 1)
+    # fpcalc already runs as separate processes; in-process decoding needs its own
+    fingerprint_pool = None
+    if FINGERPRINT_BACKEND == 'chromaprint':
+        fingerprint_pool = ProcessPoolExecutor(max_workers=STAGE_WORKERS['fingerprint'])
+    # Image resizing is CPU-bound too; it only runs when a size policy is set
+    image_pool = None
+    resized_images = collections.OrderedDict()
+    if MAX_IMAGE_EDGE or MAX_IMAGE_BYTES:
+        image_pool = ProcessPoolExecutor(max_workers=STAGE_WORKERS['resize'])
+    queues = {name: asyncio.Queue(QUEUE_SIZE) for name in STAGE_WORKERS}
+    
+    def run(func, *args):
+        return loop.run_in_executor(executor, func, *args)
+    
+    async def get_batch(queue, size):
+        # Returns (items, done); done means this worker took its sentinel
+        item = await queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        while len(batch) < size:
+            try:
+                item = await asyncio.wait_for(queue.get(), LOOKUP_BATCH_WAIT)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+    
+    async def ready_to_embed(track):
+        await queues['resize' if image_pool else 'embed'].put(track)
+    
+    async def album_worker():
+        while True:
+            tracks = await queues['album'].get()
+            if tracks is None:
+                return
+            try:
+                done, ready, remaining = await run(resolve_album, tracks, fingerprint_pool)
+            except Exception as e:
+                logger.error(f"Unexpected error resolving album {os.path.dirname(tracks[0].filepath)}: {e}")
+                # Start these over; some may already have been found to have art
+                done, ready, remaining = [], [], [Track(track.filepath) for track in tracks]
+            for track, status in done:
+                report(track.filepath, status, 'album')
+            for track in ready:
+                await ready_to_embed(track)
+            # Sampled tracks keep their fingerprint and lookup results
+            for track in remaining:
+                if track.results is not None or track.tagged_release:
+                    await queues['fetch'].put(track)
+                elif track.fingerprint:
+                    await queues['lookup'].put(track)
+                else:
+                    await queues['fingerprint'].put(track)
+    
+    async def fingerprint_worker():
+        done = False
+        while not done:
+            batch, done = await get_batch(queues['fingerprint'], FPCALC_BATCH_SIZE)
+            if not batch:
+                continue
+            try:
+                statuses = await run(prepare_tracks, batch, fingerprint_pool)
+            except Exception as e:
+                logger.error(f"Unexpected error processing {len(batch)} file(s): {e}")
+                statuses = [FAILED] * len(batch)
+            for track, status in zip(batch, statuses):
+                if status:
+                    report(track.filepath, status, 'fingerprint')
+                elif track.image_data:
+                    await ready_to_embed(track)
+                elif track.results is not None or track.tagged_release:
+                    await queues['fetch'].put(track)
+                else:
+                    await queues['lookup'].put(track)
+    
+    async def lookup_worker():
+        done = False
+        while not done:
+            batch, done = await get_batch(queues['lookup'], ACOUSTID_BATCH_SIZE)
+            if not batch:
+                continue
+            try:
+                # Tagged AcoustID ids first; misses fall back to their fingerprint
+                await asyncio.gather(*(
+                    run(resolve_tagged_trackid, track) for track in batch if track.tagged_trackid
+                ))
+                pending = [track for track in batch if track.results is None and track.fingerprint]
+                batch_results = await run(
+                    lookup_acoustid_batch, [(track.fingerprint, track.duration) for track in pending]
+                )
+            except Exception as e:
+                logger.error(f"Unexpected error during AcoustID lookup: {e}")
+                pending = [track for track in batch if track.results is None]
+                batch_results = [[] for _ in pending]
+            for track, results in zip(pending, batch_results):
+                track.results = results
+            # Tracks still without results are fingerprinted by the fetch stage
+            for track in batch:
+                await queues['fetch'].put(track)
+    
+    async def fetch_worker():
+        while True:
+            track = await queues['fetch'].get()
+            if track is None:
+                return
+            try:
+                await run(fetch_cover_art, track, fingerprint_pool)
+            except Exception as e:
+                logger.error(f"Unexpected error processing {track.filepath}: {e}")
+            if track.image_data:
+                await ready_to_embed(track)
+            else:
+                report(track.filepath, FAILED, 'fetch')
+    
+    async def resize_worker():
+        while True:
+            track = await queues['resize'].get()
+            if track is None:
+                return
+            # Images can be tens of MB; hash them off the event loop
+            key = (await run(hashlib.sha256, track.image_data)).hexdigest()
+            resized = resized_images.get(key)
+            if resized is None:
+                try:
+                    resized = await loop.run_in_executor(
+                        image_pool, apply_image_policy, track.image_data, MAX_IMAGE_EDGE, MAX_IMAGE_BYTES
+                    )
+                except Exception as e:
+                    logger.error(f"Unexpected error resizing cover art for {track.filepath}: {e}")
+                    resized = track.image_data
+                resized_images[key] = resized
+                while len(resized_images) > RESIZED_IMAGE_MEMO_SIZE:
+                    resized_images.popitem(last=False)
+            else:
+                resized_images.move_to_end(key)
+            track.image_data = resized
+            await queues['embed'].put(track)
+    
+    async def embed_worker():
+        while True:
+            track = await queues['embed'].get()
+            if track is None:
+                return
+            try:
+                embedded = await run(embed_track, track)
+            except Exception as e:
+                logger.error(f"Unexpected error processing {track.filepath}: {e}")
+                embedded = False
+            report(track.filepath, SUCCESS if embedded else FAILED, 'embed')
+    
+    workers = {
+        'album': album_worker,
+        'fingerprint': fingerprint_worker,
+        'lookup': lookup_worker,
+        'fetch': fetch_worker,
+        'resize': resize_worker,
+        'embed': embed_worker,
+    }
+    tasks = {
+        name: [asyncio.ensure_future(worker()) for _ in range(max(1, STAGE_WORKERS[name]))]
+        for name, worker in workers.items()
+    }
+    
+    try:
+        # Walking the tree can block on slow filesystems, so pull paths in the pool
+        if ALBUM_MODE:
+            iterator = group_by_directory(filepaths)
+        else:
+            iterator = iter(filepaths)
+        while True:
+            item = await run(next, iterator, None)
+            if item is None:
+                break
+            if ALBUM_MODE:
+                await queues['album'].put([Track(filepath) for filepath in item])
+            else:
+                await queues['fingerprint'].put(Track(item))
+        
+        # Drain the stages in order, one sentinel per worker
+        for name in workers:
+            for _ in tasks[name]:
+                await queues[name].put(None)
+            await asyncio.gather(*tasks[name])
+    finally:
+        for stage_tasks in tasks.values():
+            for task in stage_tasks:
+                task.cancel()
+        executor.shutdown(wait=False)
+        if fingerprint_pool is not None:
+            fingerprint_pool.shutdown(wait=False)
+        if image_pool is not None:
+            image_pool.shutdown(wait=False)
+
+class RunJournal:
+    """Crash-safe record of which files a batch run has finished.
+
+    Runs are identified by their inputs, so running the same command again
+    with --resume continues the earlier run. Every outcome is committed as
+    it happens; an interrupted run loses at most the files still in flight.
+    """
+
+    def __init__(self, path, inputs):
+        self.run = hashlib.sha256('\0'.join(sorted(inputs)).encode()).hexdigest()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(JOURNAL_SCHEMA)
+
+    def start(self):
+        """Forget any earlier run with the same inputs."""
+        with self.db:
+            self.db.execute('DELETE FROM journal WHERE run = ?', (self.run,))
+
+    def finished_paths(self, retry_failed_after):
+        """Paths an interrupted run already handled, minus failures old enough to retry."""
+        cutoff = time.time() - retry_failed_after
+        rows = self.db.execute(
+            'SELECT path FROM journal WHERE run = ? AND (status != ? OR updated_at >= ?)',
+            (self.run, FAILED, cutoff)
+        )
+        return {path for (path,) in rows}
+
+    def record(self, filepath, stage, status):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO journal (run, path, stage, status, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (self.run, filepath, stage, status, time.time())
+            )
+
+    def close(self):
+        self.db.close()
+
+def open_journal(inputs):
+    """Open the run journal for these inputs, or return None if it is unavailable."""
+    path = JOURNAL_PATH or (CACHE_DIR and os.path.join(CACHE_DIR, 'journal.db'))
+    if not path:
+        return None
+    try:
+        return RunJournal(path, inputs)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Failed to open run journal {path}, --resume will not be possible: {e}")
+        return None
+
+def find_audio_files(directory):
+    """Recursively yield audio files below a directory in sorted order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                yield os.path.abspath(os.path.join(root, name))
+
+def load_library_index(directory):
+    """Return {path: (inode, size, mtime_ns, has_art, status, checked_at)} for files below a directory."""
+    db = get_cache_db()
+    if db is None:
+        return {}
+    # Every path below directory sorts between 'directory/' and 'directory0'
+    prefix = os.path.join(os.path.abspath(directory), '')
+    try:
+        with _cache_lock:
+            rows = db.execute(
+                'SELECT path, inode, size, mtime_ns, has_art, status, checked_at FROM library '
+                'WHERE path >= ? AND path < ?',
+                (prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+            ).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read library index: {e}")
+        return {}
+    return {row[0]: row[1:] for row in rows}
+
+def needs_processing(entry, st):
+    """Decide from a file's index entry and current stat whether to queue it."""
+    if entry is None:
+        return True
+    inode, size, mtime_ns, has_art, status, checked_at = entry
+    if (inode, size, mtime_ns) != (st.st_ino, st.st_size, st.st_mtime_ns):
+        return True
+    return not has_art and time.time() - checked_at >= LIBRARY_RETRY_AFTER
+
+def scan_library(directory):
+    """Yield audio files below a directory that the library index says need work.
+
+    Index entries for files that no longer exist are dropped once the walk
+    completes.
+    """
+    index = load_library_index(directory)
+    queued = unchanged = 0
+    for filepath in find_audio_files(directory):
+        entry = index.pop(filepath, None)
+        try:
+            st = os.stat(filepath)
+        except OSError as e:
+            logger.error(f"Cannot stat {filepath}: {e}")
+            continue
+        if needs_processing(entry, st):
+            queued += 1
+            yield filepath
+        else:
+            unchanged += 1
+    logger.info(f"Library scan of {directory}: {queued} file(s) queued, {unchanged} unchanged")
+    db = get_cache_db()
+    if index and db is not None:
+        try:
+            with _cache_lock, db:
+                db.executemany('DELETE FROM library WHERE path = ?', [(path,) for path in index])
+        except sqlite3.Error as e:
+            logger.error(f"Failed to prune library index: {e}")
+
+def update_library(filepath, status):
+    """Record a file's outcome, and its stat after any embedding, in the library index."""
+    db = get_cache_db()
+    if db is None:
+        return
+    try:
+        st = os.stat(filepath)
+        with _cache_lock, db:
+            db.execute(
+                'INSERT OR REPLACE INTO library (path, inode, size, mtime_ns, has_art, status, checked_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (filepath, st.st_ino, st.st_size, st.st_mtime_ns, int(status != FAILED), status, time.time())
+            )
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Failed to update library index for {filepath}: {e}")
+
+def iter_input_files(files, directories):
+    """Yield every file named on the command line, then every directory's contents.
+
+    With INCREMENTAL, directories only contribute files the library index
+    says need work.
+    """
+    for filepath in files:
+        yield os.path.abspath(filepath)
+    for directory in directories:
+        if INCREMENTAL:
+            yield from scan_library(directory)
+        else:
+            yield from find_audio_files(directory)
+
+def print_summary(counts, failed_files):
+    """Print the batch summary in the same layout as batch_cover_art.sh."""
+    if sys.stdout.isatty():
+        red, green, yellow, blue, nc = '\033[0;31m', '\033[0;32m', '\033[1;33m', '\033[0;34m', '\033[0m'
+    else:
+        red = green = yellow = blue = nc = ''
+    total = sum(counts.values())
+    print(f"{blue}========================================{nc}")
+    print(f"{blue}=== Processing Complete ==={nc}")
+    print(f"{blue}========================================{nc}")
+    print(f"Total files:    {total}")
+    print(f"{green}Successful:     {counts[SUCCESS]}{nc}")
+    print(f"{yellow}Skipped:        {counts[SKIPPED]}{nc}")
+    print(f"{red}Failed:         {counts[FAILED]}{nc}")
+    print(f"{blue}========================================{nc}")
+    if failed_files:
+        print("")
+        print(f"{red}Failed files:{nc}")
+        for filepath in failed_files:
+            print(f"  {filepath}")
+
+def run_batch(filepaths, journal=None):
+    """Process many files in this process and print a summary. Returns the failure count.
+
+    With a journal, every outcome is recorded, and with RESUME the files an
+    interrupted run already finished are left out.
+    """
+    counts = {SUCCESS: 0, SKIPPED: 0, FAILED: 0}
+    failed_files = []
+    
+    def report(filepath, status, stage=None):
+        counts[status] += 1
+        if status == FAILED:
+            failed_files.append(filepath)
+        if INCREMENTAL:
+            update_library(filepath, status)
+        if journal is not None:
+            try:
+                journal.record(filepath, stage or 'done', status)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to record {filepath} in the run journal: {e}")
+    
+    if journal is not None:
+        if RESUME:
+            finished = journal.finished_paths(RESUME_RETRY_FAILED_AFTER)
+            if finished:
+                logger.info(f"Resuming: {len(finished)} file(s) already handled by the interrupted run")
+                filepaths = (filepath for filepath in filepaths if filepath not in finished)
+        else:
+            journal.start()
+    
+    try:
+        asyncio.run(run_pipeline(filepaths, report))
+    finally:
+        HTTP_POOL.close()
+        if journal is not None:
+            journal.close()
+    print_summary(counts, failed_files)
+    return counts[FAILED]
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Auto Cover Art Downloader')
-    parser.add_argument('file', help='Audio file to process')
+    parser.add_argument('files', nargs='*', metavar='file', help='Audio file(s) to process')
+    parser.add_argument('-r', '--recursive', action='append', default=[], metavar='DIR',
+                        help='Process every audio file below DIR (may be repeated)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help='Directory for the persistent cache (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the persistent cache')
+    parser.add_argument('--hash-files', action='store_true',
+                        help='Also match cached fingerprints by file content hash')
+    parser.add_argument('--batch-size', type=int, default=ACOUSTID_BATCH_SIZE,
+                        help='Fingerprints per AcoustID request in batch mode (default: %(default)s)')
+    parser.add_argument('--max-connections', type=int, default=HTTP_MAX_CONNECTIONS_PER_HOST,
+                        help='Keep-alive connections per host (default: %(default)s)')
+    parser.add_argument('--acoustid-rate', type=float, default=RATE_LIMITS[ACOUSTID_HOST],
+                        help='AcoustID requests per second (default: %(default)s)')
+    parser.add_argument('--caa-rate', type=float, default=0,
+                        help='Cover Art Archive requests per second, 0 for unthrottled (default: %(default)s)')
+    for stage, workers in STAGE_WORKERS.items():
+        parser.add_argument(f'--{stage}-workers', type=int, default=workers,
+                            help=f'Concurrent {stage} workers in batch mode (default: %(default)s)')
+    parser.add_argument('--fpcalc-batch-size', type=int, default=FPCALC_BATCH_SIZE,
+                        help='Files per fpcalc invocation in batch mode (default: %(default)s)')
+    parser.add_argument('--album-mode', action='store_true',
+                        help='Identify each directory as an album from a few tracks and reuse its cover art')
+    parser.add_argument('--no-local-art', action='store_true',
+                        help='Do not reuse folder images or art embedded in sibling files')
+    parser.add_argument('--folder-image-names', default=','.join(FOLDER_IMAGE_NAMES),
+                        help='Comma-separated folder image names to look for (default: %(default)s)')
+    parser.add_argument('--use-tags', action='store_true',
+                        help='Use MusicBrainz/AcoustID identifiers and fingerprints already in the tags')
+    parser.add_argument('--write-tags', action='store_true',
+                        help='Also write the AcoustID/MusicBrainz ids and fingerprint that identified the file')
+    parser.add_argument('--caa-direct', action='store_true',
+                        help="Fetch Cover Art Archive's front image directly instead of its JSON listing first")
+    parser.add_argument('--caa-size', choices=('250', '500', '1200', 'original'), default=CAA_FRONT_SIZE,
+                        help='Front image size used with --caa-direct (default: %(default)s)')
+    parser.add_argument('--max-image-edge', type=int, metavar='PX',
+                        help='Prefer thumbnails and downsize cover art to at most PX pixels per side')
+    parser.add_argument('--max-image-kb', type=int, metavar='KB',
+                        help='Re-encode cover art larger than KB kilobytes')
+    parser.add_argument('--max-candidates', type=int, default=MAX_CANDIDATES,
+                        help='Most candidate releases tried per file, best-ranked first (default: %(default)s)')
+    parser.add_argument('--probe-concurrency', type=int, default=PROBE_CONCURRENCY, metavar='K',
+                        help='Probe the top K candidate releases concurrently (default: %(default)s)')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help='Files buffered between batch stages (default: %(default)s)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process new or changed files under --recursive directories, using the library index')
+    parser.add_argument('--retry-missing-after', type=float, default=LIBRARY_RETRY_AFTER / 86400, metavar='DAYS',
+                        help='With --incremental, retry files still without cover art after DAYS (default: %(default)s)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted batch run with the same inputs instead of starting over')
+    parser.add_argument('--retry-failed-after', type=float, default=RESUME_RETRY_FAILED_AFTER / 3600, metavar='HOURS',
+                        help='With --resume, retry files that failed at least HOURS ago (default: %(default)s)')
+    parser.add_argument('--journal', default=JOURNAL_PATH, metavar='PATH',
+                        help='Run journal database (default: journal.db in the cache directory)')
+    parser.add_argument('--no-art-ttl', type=float, default=NO_ART_TTL / 86400,
+                        help='Days before a release without cover art is checked again (default: %(default)s)')
+    parser.add_argument('--image-cache-size', type=float, default=IMAGE_CACHE_MAX_BYTES / (1024 * 1024),
+                        help='Maximum size of the downloaded image cache in MB (default: %(default)s)')
+    parser.add_argument('--no-ffprobe', action='store_true',
+                        help='Never fall back to ffprobe for files mutagen cannot read')
+    parser.add_argument('--fingerprint-backend', choices=('fpcalc', 'chromaprint'), default=FINGERPRINT_BACKEND,
+                        help='fpcalc subprocess or in-process libchromaprint (default: %(default)s)')
     args = parser.parse_args()
 
-    if not os.path.exists(args.file):
-        logger.error(f"File not found: {args.file}")
-        sys.exit(1)
+    for stage in STAGE_WORKERS:
+        STAGE_WORKERS[stage] = max(1, getattr(args, f'{stage}_workers'))
+    QUEUE_SIZE = max(1, args.queue_size)
+    ALBUM_MODE = args.album_mode
+    LOCAL_ART = not args.no_local_art
+    USE_TAGS = args.use_tags
+    WRITE_TAGS = args.write_tags
+    CAA_DIRECT = args.caa_direct
+    CAA_FRONT_SIZE = args.caa_size
+    MAX_IMAGE_EDGE = args.max_image_edge or None
+    MAX_CANDIDATES = max(1, args.max_candidates)
+    PROBE_CONCURRENCY = max(1, args.probe_concurrency)
+    MAX_IMAGE_BYTES = args.max_image_kb * 1024 if args.max_image_kb else None
+    FOLDER_IMAGE_NAMES = tuple(name.strip() for name in args.folder_image_names.split(',') if name.strip())
+    FPCALC_BATCH_SIZE = max(1, args.fpcalc_batch_size)
+    RATE_LIMITS[ACOUSTID_HOST] = args.acoustid_rate or None
+    RATE_LIMITS[COVERARTARCHIVE_HOST] = args.caa_rate or None
+    HTTP_POOL.max_per_host = max(1, args.max_connections)
+    ACOUSTID_BATCH_SIZE = max(1, args.batch_size)
+    CACHE_DIR = None if args.no_cache else args.cache_dir
+    HASH_FILES = args.hash_files
+    NO_ART_TTL = args.no_art_ttl * 86400
+    FINGERPRINT_BACKEND = args.fingerprint_backend
+    FFPROBE_FALLBACK = not args.no_ffprobe
+    IMAGE_CACHE_MAX_BYTES = int(args.image_cache_size * 1024 * 1024)
+    INCREMENTAL = args.incremental
+    LIBRARY_RETRY_AFTER = args.retry_missing_after * 86400
+    JOURNAL_PATH = args.journal
+    RESUME = args.resume
+    RESUME_RETRY_FAILED_AFTER = args.retry_failed_after * 3600
+
+    if not args.files and not args.recursive:
+        parser.error('no files or directories given')
+    if INCREMENTAL and not CACHE_DIR:
+        logger.warning("--incremental needs the cache; every file will be scanned")
+    if RESUME and not (JOURNAL_PATH or CACHE_DIR):
+        logger.warning("--resume needs the cache or --journal; every file will be processed")
+
+    for path in args.files:
+        if not os.path.isfile(path):
+            logger.error(f"File not found: {path}")
+            sys.exit(1)
+    for path in args.recursive:
+        if not os.path.isdir(path):
+            logger.error(f"Directory not found: {path}")
+            sys.exit(1)
 
-    success = process_file(os.path.abspath(args.file))
-    sys.exit(0 if success else 1)
+    # A single file keeps the original quiet exit-code-only behaviour
+    if len(args.files) == 1 and not args.recursive:
+        try:
+            status = process_file(os.path.abspath(args.files[0]))
+        finally:
+            HTTP_POOL.close()
+        sys.exit(1 if status == FAILED else 0)
 
+    inputs = [os.path.abspath(path) for path in args.files + args.recursive]
+    failures = run_batch(iter_input_files(args.files, args.recursive), open_journal(inputs))
+    sys.exit(1 if failures else 0)
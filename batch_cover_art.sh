@@ -14,8 +14,8 @@ NC='\033[0m' # No Color
 
 # Check if directory argument is provided
 if [ $# -eq 0 ]; then
-    echo "Usage: $0 <directory>"
-    echo "Example: $0 ~/Music"
+    echo "Usage: $0 <directory> [auto_cover_art.py options...]"
+    echo "Example: $0 ~/Music --resume"
     exit 1
 fi
 
@@ -86,63 +86,8 @@ if [[ ! $REPLY =~ ^[Yy]$ ]]; then
     exit 0
 fi
 
-# Process files
+# Process files in a single long-lived interpreter
 echo -e "${BLUE}Starting batch processing...${NC}"
 echo ""
 
-SUCCESS_COUNT=0
-FAILURE_COUNT=0
-SKIPPED_COUNT=0
-FAILED_FILES=()
-
-for i in "${!FILES[@]}"; do
-    file="${FILES[$i]}"
-    current=$((i + 1))
-    total=${#FILES[@]}
-    
-    echo -e "${BLUE}[$current/$total]${NC} Processing: ${YELLOW}$(basename "$file")${NC}"
-    
-    if python3 "$AUTO_COVER_ART" "$file"; then
-        SUCCESS_COUNT=$((SUCCESS_COUNT + 1))
-        echo -e "${GREEN}✓ Success${NC}"
-    else
-        exit_code=$?
-        if [ $exit_code -eq 0 ]; then
-            # File was skipped (already has cover art)
-            SKIPPED_COUNT=$((SKIPPED_COUNT + 1))
-            echo -e "${YELLOW}○ Skipped (already has cover art)${NC}"
-        else
-            # File processing failed
-            FAILURE_COUNT=$((FAILURE_COUNT + 1))
-            FAILED_FILES+=("$file")
-            echo -e "${RED}✗ Failed${NC}"
-        fi
-    fi
-    echo ""
-done
-
-# Print summary
-echo -e "${BLUE}========================================${NC}"
-echo -e "${BLUE}=== Processing Complete ===${NC}"
-echo -e "${BLUE}========================================${NC}"
-echo -e "Total files:    ${total}"
-echo -e "${GREEN}Successful:     ${SUCCESS_COUNT}${NC}"
-echo -e "${YELLOW}Skipped:        ${SKIPPED_COUNT}${NC}"
-echo -e "${RED}Failed:         ${FAILURE_COUNT}${NC}"
-echo -e "${BLUE}========================================${NC}"
-
-# Print failed files if any
-if [ $FAILURE_COUNT -gt 0 ]; then
-    echo ""
-    echo -e "${RED}Failed files:${NC}"
-    for file in "${FAILED_FILES[@]}"; do
-        echo "  $file"
-    done
-fi
-
-# Exit with appropriate code
-if [ $FAILURE_COUNT -gt 0 ]; then
-    exit 1
-else
-    exit 0
-fi
+exec python3 "$AUTO_COVER_ART" --recursive "$TARGET_DIR" "${@:2}"
@@ -0,0 +1,18 @@
+"""Shared test setup: makes auto_cover_art importable and patches its globals."""
+import os
+import sys
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The module exits on import without an API key
+os.environ.setdefault('ACOUSTID_API_KEY', 'test')
+
+import auto_cover_art  # noqa: E402
+
+
+def patch_module(testcase, **attrs):
+    """Replace auto_cover_art attributes until the end of the test."""
+    for name, value in attrs.items():
+        patcher = mock.patch.object(auto_cover_art, name, value)
+        patcher.start()
+        testcase.addCleanup(patcher.stop)
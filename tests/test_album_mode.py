@@ -0,0 +1,91 @@
+import asyncio
+import os
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from support import auto_cover_art, patch_module
+
+
+def fake_audio(filepath):
+    # Track n of the folder is 100 + 10 * n seconds long
+    number = int(os.path.splitext(os.path.basename(filepath))[0])
+    return types.SimpleNamespace(info=types.SimpleNamespace(length=100 + 10 * number), tags=None)
+
+
+def fake_fingerprint(tracks, pool=None):
+    for track in tracks:
+        track.fingerprint, track.duration = 'FP', 100
+
+
+def fake_lookup(items):
+    return [[{'recordings': [{'releases': [{'id': 'REL'}]}]}] for _ in items]
+
+
+class ResolveAlbumTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for number in (1, 2, 3):
+            open(os.path.join(self.directory.name, f'{number}.mp3'), 'wb').close()
+        patch_module(
+            self,
+            CACHE_DIR=None,
+            LOCAL_ART=False,
+            load_audio=fake_audio,
+            has_cover_art=lambda filepath, audio=None: False,
+            fingerprint_tracks=fake_fingerprint,
+            lookup_cached_fingerprint=lambda track: False,
+            lookup_acoustid_batch=fake_lookup,
+            get_release_track_lengths=lambda release_id: [[110, 120, 130]],
+            fetch_release_cover=lambda release_id: b'IMG',
+        )
+        self.addCleanup(self.directory.cleanup)
+
+    def track(self, number):
+        return auto_cover_art.Track(os.path.join(self.directory.name, f'{number}.mp3'))
+
+    def test_whole_folder_matches(self):
+        done, ready, remaining = auto_cover_art.resolve_album([self.track(n) for n in (1, 2, 3)])
+        self.assertEqual((len(done), len(ready), len(remaining)), (0, 3, 0))
+
+    def test_partial_group_matches_folder_size(self):
+        # --incremental or --resume may queue only some of the folder
+        done, ready, remaining = auto_cover_art.resolve_album([self.track(1), self.track(3)])
+        self.assertEqual((len(ready), len(remaining)), (2, 0))
+        self.assertTrue(all(track.image_data == b'IMG' for track in ready))
+
+    def test_disc_folder_matches_one_medium(self):
+        # A two-disc release whose second disc is this folder
+        media = [[200, 210, 220, 230], [110, 120, 130]]
+        with mock.patch.object(auto_cover_art, 'get_release_track_lengths', lambda release_id: media):
+            done, ready, remaining = auto_cover_art.resolve_album([self.track(n) for n in (1, 2, 3)])
+        self.assertEqual((len(ready), len(remaining)), (3, 0))
+
+    def test_no_medium_fits(self):
+        media = [[200, 210], [300, 310]]
+        with mock.patch.object(auto_cover_art, 'get_release_track_lengths', lambda release_id: media):
+            done, ready, remaining = auto_cover_art.resolve_album([self.track(n) for n in (1, 2, 3)])
+        self.assertEqual((len(ready), len(remaining)), (0, 3))
+
+    def test_error_rechecks_tracks(self):
+        reports = []
+
+        def failing_resolve(tracks, pool=None):
+            for track in tracks:
+                auto_cover_art.check_file(track)
+            raise RuntimeError('boom')
+
+        with mock.patch.object(auto_cover_art, 'ALBUM_MODE', True), \
+                mock.patch.object(auto_cover_art, 'resolve_album', failing_resolve), \
+                mock.patch.object(auto_cover_art, 'has_cover_art', lambda filepath, audio=None: True):
+            paths = [track.filepath for track in (self.track(1), self.track(2))]
+            asyncio.run(auto_cover_art.run_pipeline(
+                iter(paths), lambda filepath, status, stage=None: reports.append(status)
+            ))
+        # Files that already have art are skipped again, never re-embedded
+        self.assertEqual(reports, [auto_cover_art.SKIPPED] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
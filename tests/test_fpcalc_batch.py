@@ -0,0 +1,93 @@
+import subprocess
+import unittest
+from unittest import mock
+
+from support import auto_cover_art
+
+FILES = ['/music/01 Intro.flac', '/music/02 Broken.mp3', '/music/03 Outro.m4a']
+
+# fpcalc's text writer: a FILE= line per input when given several files,
+# records separated by a blank line, and errors only on stderr, so a
+# corrupt file simply has no record
+MULTI_FILE_OUTPUT = (
+    'FILE=/music/01 Intro.flac\n'
+    'DURATION=183\n'
+    'FINGERPRINT=AQADtEmUaEkSRZEGAAAAAA\n'
+    '\n'
+    'FILE=/music/03 Outro.m4a\n'
+    'DURATION=241\n'
+    'FINGERPRINT=AQADtNISaUkiJYmSBAAAAA\n'
+)
+CORRUPT_STDERR = (
+    'ERROR: Error decoding audio frame (Invalid data found when processing input)\n'
+)
+
+UNNAMED_OUTPUT = (
+    'DURATION=183\n'
+    'FINGERPRINT=AQADtEmUaEkSRZEGAAAAAA\n'
+    '\n'
+    'DURATION=96\n'
+    'FINGERPRINT=AQADtFKSJEqSKEkiAAAAAA\n'
+    '\n'
+    'DURATION=241\n'
+    'FINGERPRINT=AQADtNISaUkiJYmSBAAAAA\n'
+)
+
+
+def completed(stdout, stderr='', returncode=0):
+    return subprocess.CompletedProcess(['fpcalc'], returncode, stdout, stderr)
+
+
+class ParseFpcalcTextTest(unittest.TestCase):
+    def test_blocks_with_file_lines(self):
+        blocks = auto_cover_art.parse_fpcalc_text(MULTI_FILE_OUTPUT)
+        self.assertEqual([b['FILE'] for b in blocks], [FILES[0], FILES[2]])
+        self.assertEqual(blocks[1]['DURATION'], '241')
+
+    def test_blocks_without_separators(self):
+        output = UNNAMED_OUTPUT.replace('\n\n', '\n')
+        blocks = auto_cover_art.parse_fpcalc_text(output)
+        self.assertEqual([b['DURATION'] for b in blocks], ['183', '96', '241'])
+
+    def test_file_lines_without_blank_lines(self):
+        output = MULTI_FILE_OUTPUT.replace('\n\n', '\n')
+        blocks = auto_cover_art.parse_fpcalc_text(output)
+        self.assertEqual([b['FILE'] for b in blocks], [FILES[0], FILES[2]])
+
+
+class RunFpcalcBatchTest(unittest.TestCase):
+    def run_batch(self, stdout, stderr='', returncode=0, single=(None, None)):
+        with mock.patch.object(auto_cover_art.subprocess, 'run',
+                               return_value=completed(stdout, stderr, returncode)) as run, \
+                mock.patch.object(auto_cover_art, 'run_fpcalc', return_value=single) as run_fpcalc:
+            fingerprints = auto_cover_art.run_fpcalc_batch(FILES)
+        self.assertEqual(run.call_count, 1)
+        return fingerprints, run_fpcalc
+
+    def test_corrupt_file_in_the_middle(self):
+        fingerprints, run_fpcalc = self.run_batch(MULTI_FILE_OUTPUT, CORRUPT_STDERR, returncode=1)
+        self.assertEqual(fingerprints[FILES[0]], ('AQADtEmUaEkSRZEGAAAAAA', 183))
+        self.assertEqual(fingerprints[FILES[2]], ('AQADtNISaUkiJYmSBAAAAA', 241))
+        self.assertEqual(fingerprints[FILES[1]], (None, None))
+        # Only the corrupt file is retried on its own
+        run_fpcalc.assert_called_once_with(FILES[1])
+
+    def test_unnamed_blocks_map_by_position(self):
+        fingerprints, run_fpcalc = self.run_batch(UNNAMED_OUTPUT)
+        self.assertEqual(fingerprints[FILES[1]], ('AQADtFKSJEqSKEkiAAAAAA', 96))
+        run_fpcalc.assert_not_called()
+
+    def test_unnamed_blocks_without_separators_map_by_position(self):
+        fingerprints, run_fpcalc = self.run_batch(UNNAMED_OUTPUT.replace('\n\n', '\n'))
+        self.assertEqual(fingerprints[FILES[2]], ('AQADtNISaUkiJYmSBAAAAA', 241))
+        run_fpcalc.assert_not_called()
+
+    def test_unnamed_blocks_with_a_gap_fall_back_to_single_runs(self):
+        output = UNNAMED_OUTPUT.split('\n\n', 1)[1]
+        fingerprints, run_fpcalc = self.run_batch(output, CORRUPT_STDERR, returncode=1, single=('FP', 10))
+        self.assertEqual(run_fpcalc.call_count, len(FILES))
+        self.assertEqual(fingerprints[FILES[0]], ('FP', 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from support import auto_cover_art, patch_module
+
+FILES = [f'/music/{i}.mp3' for i in range(10)]
+FAILING = {'/music/0.mp3', '/music/3.mp3'}
+
+
+class RunJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.processed = []
+        patch_module(
+            self,
+            JOURNAL_PATH=os.path.join(self.directory.name, 'journal.db'),
+            run_pipeline=self.fake_pipeline,
+            print_summary=lambda counts, failed_files: None,
+        )
+        self.interrupt_at = None
+
+    async def fake_pipeline(self, filepaths, report):
+        for filepath in filepaths:
+            if filepath == self.interrupt_at:
+                self.interrupt_at = None
+                raise KeyboardInterrupt
+            self.processed.append(filepath)
+            report(filepath, auto_cover_art.FAILED if filepath in FAILING else auto_cover_art.SUCCESS, 'embed')
+
+    def run_batch(self, resume=False, retry_failed_after=3600):
+        self.processed = []
+        with mock.patch.object(auto_cover_art, 'RESUME', resume), \
+                mock.patch.object(auto_cover_art, 'RESUME_RETRY_FAILED_AFTER', retry_failed_after):
+            auto_cover_art.run_batch(iter(FILES), auto_cover_art.open_journal(['/music']))
+        return self.processed
+
+    def interrupted_run(self):
+        self.interrupt_at = '/music/5.mp3'
+        with self.assertRaises(KeyboardInterrupt):
+            self.run_batch()
+
+    def test_resume_skips_finished_and_recently_failed_files(self):
+        self.interrupted_run()
+        self.assertEqual(self.run_batch(resume=True), FILES[5:])
+
+    def test_resume_retries_old_failures(self):
+        self.interrupted_run()
+        self.assertEqual(self.run_batch(resume=True, retry_failed_after=0), ['/music/0.mp3', '/music/3.mp3'] + FILES[5:])
+
+    def test_without_resume_starts_over(self):
+        self.interrupted_run()
+        self.assertEqual(self.run_batch(), FILES)
+
+    def test_runs_are_keyed_by_inputs(self):
+        self.interrupted_run()
+        with mock.patch.object(auto_cover_art, 'RESUME', True):
+            self.processed = []
+            auto_cover_art.run_batch(iter(FILES), auto_cover_art.open_journal(['/other']))
+        self.assertEqual(self.processed, FILES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from support import auto_cover_art, patch_module
+
+
+class LibraryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = tempfile.TemporaryDirectory()
+        self.library = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache.cleanup)
+        self.addCleanup(self.library.cleanup)
+        self.album = os.path.join(self.library.name, 'album')
+        os.mkdir(self.album)
+        for name in ('1.mp3', '2.mp3', '3.mp3'):
+            open(os.path.join(self.album, name), 'wb').close()
+        # Sorts right after 'album/' but lies outside it
+        open(os.path.join(self.library.name, 'album0.mp3'), 'wb').close()
+        patch_module(
+            self,
+            CACHE_DIR=self.cache.name,
+            _cache_db=None,
+            INCREMENTAL=True,
+            LIBRARY_RETRY_AFTER=3600,
+        )
+        self.addCleanup(lambda: auto_cover_art._cache_db and auto_cover_art._cache_db.close())
+
+    def path(self, name):
+        return os.path.join(self.album, name)
+
+    def scan(self):
+        return [os.path.basename(path) for path in auto_cover_art.iter_input_files([], [self.album])]
+
+    def test_new_files_are_queued(self):
+        self.assertEqual(self.scan(), ['1.mp3', '2.mp3', '3.mp3'])
+
+    def test_unchanged_files_are_not_queued(self):
+        auto_cover_art.update_library(self.path('1.mp3'), auto_cover_art.SUCCESS)
+        auto_cover_art.update_library(self.path('2.mp3'), auto_cover_art.SKIPPED)
+        self.assertEqual(self.scan(), ['3.mp3'])
+
+    def test_changed_files_are_queued(self):
+        auto_cover_art.update_library(self.path('1.mp3'), auto_cover_art.SUCCESS)
+        os.utime(self.path('1.mp3'), ns=(1, 1))
+        self.assertIn('1.mp3', self.scan())
+
+    def test_missing_art_is_retried_after_the_window(self):
+        auto_cover_art.update_library(self.path('1.mp3'), auto_cover_art.FAILED)
+        self.assertNotIn('1.mp3', self.scan())
+        with mock.patch.object(auto_cover_art, 'LIBRARY_RETRY_AFTER', 0):
+            self.assertIn('1.mp3', self.scan())
+
+    def test_deleted_files_are_pruned(self):
+        auto_cover_art.update_library(self.path('1.mp3'), auto_cover_art.SUCCESS)
+        auto_cover_art.update_library(os.path.join(self.library.name, 'album0.mp3'), auto_cover_art.SUCCESS)
+        os.remove(self.path('1.mp3'))
+        self.scan()
+        self.assertEqual(auto_cover_art.load_library_index(self.album), {})
+        self.assertEqual(len(auto_cover_art.load_library_index(self.library.name)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import collections
+import os
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from support import auto_cover_art, patch_module
+
+# name -> (album tag, embedded art)
+FOLDER = {
+    'a.flac': ('Album X', b'ART-X'),
+    'b.flac': (None, None),
+    'c.flac': ('Album X', None),
+    'd.flac': ('Album Y', None),
+}
+
+
+class LocalArtTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for name in FOLDER:
+            open(self.path(name), 'wb').close()
+        self.loads = collections.Counter()
+
+        def load_audio(filepath):
+            self.loads[filepath] += 1
+            album, art = FOLDER[os.path.basename(filepath)]
+            return types.SimpleNamespace(album=album, art=art, info=None, tags=None)
+
+        patch_module(
+            self,
+            CACHE_DIR=None,
+            load_audio=load_audio,
+            audio_has_picture=lambda audio: audio.art is not None,
+            extract_cover_art=lambda audio: audio.art,
+            read_tag=lambda audio, name: audio.album,
+            _local_art_memo=collections.OrderedDict(),
+        )
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def local_art(self, name):
+        track = auto_cover_art.Track(self.path(name))
+        track.audio = auto_cover_art.load_audio(track.filepath)
+        return auto_cover_art.find_local_cover_art(track)
+
+    def test_same_album_sibling(self):
+        self.assertEqual(self.local_art('c.flac'), b'ART-X')
+
+    def test_untagged_track_gets_no_sibling_art(self):
+        self.assertIsNone(self.local_art('b.flac'))
+
+    def test_other_album_gets_no_sibling_art(self):
+        self.assertIsNone(self.local_art('d.flac'))
+
+    def test_folder_image_wins(self):
+        with open(self.path('cover.jpg'), 'wb') as f:
+            f.write(b'FOLDER')
+        self.assertEqual(self.local_art('b.flac'), b'FOLDER')
+
+    def test_prepare_tracks_parses_each_file_once(self):
+        tracks = [auto_cover_art.Track(self.path(name)) for name in sorted(FOLDER)]
+        with mock.patch.object(auto_cover_art, 'has_cover_art', lambda filepath, audio=None: audio.art is not None), \
+                mock.patch.object(auto_cover_art, 'lookup_cached_fingerprint', lambda track: False), \
+                mock.patch.object(auto_cover_art, 'fingerprint_tracks', lambda tracks, pool=None: None):
+            auto_cover_art.prepare_tracks(tracks)
+        self.assertEqual(set(self.loads.values()), {1})
+        self.assertEqual(tracks[2].image_data, b'ART-X')
+
+    def test_sampling_failure_keeps_local_art_tracks(self):
+        tracks = [auto_cover_art.Track(self.path(name)) for name in ('b.flac', 'c.flac', 'd.flac')]
+        with mock.patch.object(auto_cover_art, 'has_cover_art', lambda filepath, audio=None: False), \
+                mock.patch.object(auto_cover_art, 'lookup_cached_fingerprint', lambda track: False), \
+                mock.patch.object(auto_cover_art, 'fingerprint_tracks', lambda tracks, pool=None: None):
+            done, ready, remaining = auto_cover_art.resolve_album(tracks)
+        self.assertEqual([os.path.basename(t.filepath) for t in ready], ['c.flac'])
+        self.assertEqual(len(remaining), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
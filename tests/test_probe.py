@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from support import auto_cover_art, patch_module
+
+
+def candidates(count):
+    return [({'title': f'rel{i}'}, {'musicbrainz_albumid': f'rel{i}'}) for i in range(count)]
+
+
+class FakePool:
+    """Answers HEAD requests for CAA front images; releases in missing have none."""
+
+    def __init__(self, missing=(), delay=0):
+        self.missing = set(missing)
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, timeout=30):
+        release_id = url.split('/')[-2]
+        with self._lock:
+            self.requests.append((method, release_id))
+        time.sleep(self.delay)
+        return (404 if release_id in self.missing else 200), 'OK', {}, b''
+
+
+class ProbeCoverArtTest(unittest.TestCase):
+    def setUp(self):
+        self.downloads = []
+        patch_module(
+            self,
+            CACHE_DIR=None,
+            CAA_DIRECT=True,
+            PROBE_CONCURRENCY=4,
+            _release_art_memo={},
+            get_cover_art_url=lambda release_id: None,
+            fetch_image=self.fetch_image,
+        )
+
+    def fetch_image(self, url):
+        self.downloads.append(url.split('/')[-2])
+        return b'IMG'
+
+    def test_only_the_winner_is_downloaded(self):
+        pool = FakePool()
+        with mock.patch.object(auto_cover_art, 'HTTP_POOL', pool):
+            image_data, identifiers = auto_cover_art.probe_cover_art(candidates(6))
+        self.assertEqual(identifiers['musicbrainz_albumid'], 'rel0')
+        self.assertEqual(self.downloads, ['rel0'])
+        self.assertTrue(all(method == 'HEAD' for method, _ in pool.requests))
+
+    def test_rank_order_wins_over_speed(self):
+        pool = FakePool(missing={'rel0', 'rel1'})
+        with mock.patch.object(auto_cover_art, 'HTTP_POOL', pool):
+            image_data, identifiers = auto_cover_art.probe_cover_art(candidates(6))
+        self.assertEqual(identifiers['musicbrainz_albumid'], 'rel2')
+        self.assertEqual(self.downloads, ['rel2'])
+
+    def test_no_art_anywhere(self):
+        pool = FakePool(missing={f'rel{i}' for i in range(3)})
+        with mock.patch.object(auto_cover_art, 'HTTP_POOL', pool):
+            self.assertEqual(auto_cover_art.probe_cover_art(candidates(3)), (None, None))
+        self.assertEqual(self.downloads, [])
+
+    def test_concurrent_probes_of_one_release_share_a_request(self):
+        pool = FakePool(delay=0.2)
+        results = []
+
+        def locate():
+            results.append(auto_cover_art.locate_release_cover('REL', False))
+
+        with mock.patch.object(auto_cover_art, 'HTTP_POOL', pool):
+            threads = [threading.Thread(target=locate) for _ in range(12)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(pool.requests, [('HEAD', 'REL')])
+        self.assertEqual(len(set(results)), 1)
+        self.assertIsNotNone(results[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from support import auto_cover_art
+
+
+class SingleFlightTest(unittest.TestCase):
+    def run_concurrently(self, flight, func, count=8):
+        results, errors = [], []
+
+        def call():
+            try:
+                results.append(flight.do('key', func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'result'
+
+        results, errors = self.run_concurrently(auto_cover_art.SingleFlight(), slow)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 8)
+        self.assertEqual(errors, [])
+
+    def test_errors_reach_every_caller(self):
+        def failing():
+            time.sleep(0.2)
+            raise ValueError('upstream down')
+
+        results, errors = self.run_concurrently(auto_cover_art.SingleFlight(), failing)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 8)
+
+    def test_finished_calls_are_not_kept(self):
+        flight = auto_cover_art.SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+
+    def test_batch_sends_duplicate_fingerprints_once(self):
+        sent = []
+
+        def lookup(items):
+            sent.append(items)
+            return [[fingerprint] for fingerprint, duration in items]
+
+        lookup_batch = auto_cover_art.lookup_acoustid_batch
+        # Only the outer call deduplicates; its recursive call reaches the stub
+        with mock.patch.object(auto_cover_art, 'lookup_acoustid_batch', lookup):
+            results = lookup_batch([('A', 1), ('B', 2), ('A', 1)])
+        self.assertEqual(sent, [[('A', 1), ('B', 2)]])
+        self.assertEqual(results, [['A'], ['B'], ['A']])
+
+
+if __name__ == '__main__':
+    unittest.main()
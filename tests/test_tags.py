@@ -0,0 +1,94 @@
+import asyncio
+import types
+import unittest
+from unittest import mock
+
+from support import auto_cover_art, patch_module
+
+RESULTS = [{'recordings': [{'releases': [{'id': 'ACOUSTIC'}]}]}]
+
+
+class TaggedIdentifiersTest(unittest.TestCase):
+    """Tagged identifiers are only read by check_file; the network work happens in later stages."""
+
+    def setUp(self):
+        self.tags = {}
+        self.fingerprinted = []
+        self.releases = []
+        patch_module(
+            self,
+            CACHE_DIR=None,
+            USE_TAGS=True,
+            LOCAL_ART=False,
+            load_audio=lambda filepath: types.SimpleNamespace(
+                filepath=filepath, info=types.SimpleNamespace(length=100), tags=None
+            ),
+            has_cover_art=lambda filepath, audio=None: False,
+            read_tag=lambda audio, name: self.tags.get(audio.filepath, {}).get(name),
+            lookup_cached_fingerprint=lambda track: False,
+            fingerprint_tracks=self.fingerprint_tracks,
+            fetch_release_cover=self.fetch_release_cover,
+            lookup_acoustid=lambda fingerprint, duration: RESULTS,
+            lookup_acoustid_batch=lambda items: [RESULTS for _ in items],
+            embed_track=lambda track: True,
+        )
+
+    def fingerprint_tracks(self, tracks, pool=None):
+        for track in tracks:
+            self.fingerprinted.append(track.filepath)
+            track.fingerprint, track.duration = 'FP', 100
+
+    def fetch_release_cover(self, release_id):
+        self.releases.append(release_id)
+        return None if release_id == 'NOART' else b'IMG'
+
+    def run_pipeline(self, filepaths):
+        reports = {}
+        asyncio.run(auto_cover_art.run_pipeline(
+            iter(filepaths), lambda filepath, status, stage=None: reports.__setitem__(filepath, status)
+        ))
+        return reports
+
+    def test_check_file_only_records_the_tagged_release(self):
+        self.tags['/m/1.mp3'] = {'musicbrainz_albumid': 'TAGGED'}
+        track = auto_cover_art.Track('/m/1.mp3')
+        self.assertIsNone(auto_cover_art.check_file(track))
+        self.assertEqual(track.tagged_release, 'TAGGED')
+        self.assertEqual(self.releases, [])
+
+    def test_tagged_release_skips_fingerprinting(self):
+        self.tags['/m/1.mp3'] = {'musicbrainz_albumid': 'TAGGED'}
+        reports = self.run_pipeline(['/m/1.mp3', '/m/2.mp3'])
+        self.assertEqual(reports, {'/m/1.mp3': auto_cover_art.SUCCESS, '/m/2.mp3': auto_cover_art.SUCCESS})
+        self.assertEqual(self.fingerprinted, ['/m/2.mp3'])
+        self.assertEqual(sorted(self.releases), ['ACOUSTIC', 'TAGGED'])
+
+    def test_tagged_release_without_art_falls_back_to_acoustid(self):
+        self.tags['/m/1.mp3'] = {'musicbrainz_albumid': 'NOART'}
+        reports = self.run_pipeline(['/m/1.mp3'])
+        self.assertEqual(reports, {'/m/1.mp3': auto_cover_art.SUCCESS})
+        self.assertEqual(self.fingerprinted, ['/m/1.mp3'])
+        self.assertEqual(self.releases, ['NOART', 'ACOUSTIC'])
+
+    def test_tagged_trackid_is_resolved_in_the_lookup_stage(self):
+        self.tags['/m/1.mp3'] = {'acoustid_id': 'HIT'}
+        self.tags['/m/2.mp3'] = {'acoustid_id': 'MISS'}
+        trackids = []
+
+        def lookup_trackid(trackid):
+            trackids.append(trackid)
+            return RESULTS if trackid == 'HIT' else []
+
+        track = auto_cover_art.Track('/m/1.mp3')
+        with mock.patch.object(auto_cover_art, 'lookup_acoustid_trackid', lookup_trackid):
+            auto_cover_art.check_file(track)
+            self.assertEqual((track.tagged_trackid, trackids), ('HIT', []))
+            reports = self.run_pipeline(['/m/1.mp3', '/m/2.mp3'])
+        self.assertEqual(set(reports.values()), {auto_cover_art.SUCCESS})
+        self.assertEqual(sorted(trackids), ['HIT', 'MISS'])
+        # Only the id without results needed decoding
+        self.assertEqual(self.fingerprinted, ['/m/2.mp3'])
+
+
+if __name__ == '__main__':
+    unittest.main()